@@ -0,0 +1,59 @@
+import copy
+from arborator.parameters import get_parser, get_config
+from arborator.constants import (CONFIG_KEY, METADATA_KEY, METADATA_LONG, OUTDIR_KEY, OUTDIR_LONG, PROFILE_KEY,
+                                 PROFILE_LONG)
+
+def get_run_config(config=None, parameters={}):
+    '''
+    Creates the parameters of a run the same way as for the command line: defaults, then the given parameters, then
+    the parameters of the config
+    :param config: dict of parameters as in a config file, or path to a config file, None for none
+    :param parameters: dict of parameters by their command line name
+    :return: dict of parameters
+    '''
+    run_config = vars(get_parser().parse_args([PROFILE_LONG, '', METADATA_LONG, '', OUTDIR_LONG, '']))
+    for field in parameters:
+        run_config[field] = parameters[field]
+
+    if isinstance(config, dict):
+        # The config is updated while the run is checked, the caller's copy is left as it is:
+        for field in config:
+            run_config[field] = copy.deepcopy(config[field])
+    else:
+        run_config[CONFIG_KEY] = config
+    return get_config(run_config)
+
+def run(profiles, metadata, config=None, outdir=None, **parameters):
+    '''
+    Runs arborator on allele profiles and metadata held in memory and returns the results in memory, without
+    writing any file unless an output directory is given
+    :param profiles: pandas DataFrame or pyarrow Table of the allele profiles, the first column is the sample id, or a
+                     path to a profile file
+    :param metadata: pandas DataFrame or pyarrow Table of the metadata, or a path to a metadata file
+    :param config: dict of parameters as in a config file, or path to a config file
+    :param outdir: directory to also write the outputs of the command line to, None to write nothing
+    :param parameters: other parameters by their command line name (thresholds, partition_col, id_col, ...)
+    :return: dict of results, or dict of partition column: results with several partition columns. The results are:
+             cluster_summary: pd as in cluster_summary.tsv
+             linelist: pd as in metadata.included.tsv, None if no group was clustered
+             addresses: dict of group id: pd of the sample ids and cluster addresses of a clustered group
+             stats: pd of the distance statistics and outliers of every group, indexed by group id
+             outliers: dict of group id: pd of the pairwise outliers (id1, id2, dist) of a clustered group
+             trees: dict of group id: newick tree of a clustered group
+             sweep: dict of the addresses of each setting and the cluster counts of a sweep, None without a sweep
+             run_data: dict as in run.json
+    '''
+    run_config = get_run_config(config, parameters)
+    run_config[PROFILE_KEY] = profiles if isinstance(profiles, str) else None
+    run_config[METADATA_KEY] = metadata if isinstance(metadata, str) else None
+    run_config[OUTDIR_KEY] = outdir
+
+    # The scientific stack is only imported once a run starts:
+    from arborator.utils import encode_profiles, cluster_reporter
+    encoded_profiles = encode_profiles(profiles)
+    if len(encoded_profiles['sample_ids']) == 0:
+        message = 'No profile rows were provided.'
+        raise Exception(message)
+
+    return cluster_reporter(run_config, encoded_profiles=encoded_profiles, in_memory=True,
+                            metadata_table=None if isinstance(metadata, str) else metadata)
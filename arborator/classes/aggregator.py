@@ -1,181 +1,186 @@
-import sys
-from statistics import mean, median
+import numpy as np
 import pandas as pd
 
 
 class summarizer:
+    """
+    Summarizes the metadata columns of all groups at once.
+
+    The metadata rows of every group are aggregated together with groupby
+    over their group id. The data type of a column is resolved once and each
+    distinct value is parsed as a number or a date once per column, instead
+    of once per group.
+    """
     valid_types = [
         'categorical',
         'min_max',
         'desc_stats',
         'none'
     ]
-
-    def __init__(self,header,dictionary,field_data_types,field_name_key,field_name_value):
-        self.header = sorted(header + self.get_fields(dictionary,field_data_types,field_name_key,field_name_value))
-
-        self.data = self.populate_records(dictionary,field_data_types,field_name_key,field_name_value)
-
-
-    def get_fields(self,dictionary,field_data_types,field_name_key,field_name_value):
-        output_fields = []
-        for group_id in dictionary:
-            m = dictionary[group_id][field_name_key]
-            for col in m:
-                col_dtype = 'categorical'
-                c = col.split(' ')
-                if 'age' in c:
-                    col_dtype = 'desc_stats'
-                if 'date' in c:
-                    col_dtype = 'min_max'
-                c = col.split('_')
-                if 'age' in c:
-                    col_dtype = 'desc_stats'
-                if 'date' in c:
-                    col_dtype = 'min_max'
-                if col in field_data_types:
-                    col_dtype = field_data_types[col]["data_type"]
-                if col_dtype not in self.valid_types:
-                    col_dtype = 'categorical'
-
-                if col_dtype == 'categorical':
-                    values = list(m[col][field_name_value].keys())
-                    for value in values:
-                        k = f"count_{col}_{value}"
-                        output_fields.append(k)
-
-                elif col_dtype == 'min_max':
-                    output_fields += [f'{col}_min_value',f'{col}_max_value']
-                elif col_dtype == 'desc_stats':
-                    output_fields += [f'{col}_min_value', f'{col}_mean_value', f'{col}_median_value',f'{col}_max_value']
-                elif col_dtype == 'None':
-                    output_fields.append(col)
-        output_fields = sorted(list(set(output_fields)))
-        return output_fields
-
-    def create_record(self,header,field_data_types):
-        record = {}
-        for f in header:
-            record[f] = ''
-            if ('count_' in f or '_value') and not '_date' in f:
-                record[f] = 0
-            if f in field_data_types and "default" in field_data_types[f]:
-                record[f] = field_data_types[f]["default"]
-        return record
-
-
-    def calc_desc_stats_numerical(self,values):
-        s = {
-            'min':'nan',
-            'median':'nan',
-            'mean':'nan',
-            'max':'nan',
-        }
-        if len(values) > 0:
-            s = {
-                'min': min(values),
-                'median': mean(values),
-                'mean': median(values),
-                'max':max(values),
-            }
-        return s
-
-    def calc_desc_stats_dates(self,values):
-        values = sorted(self.convert_date(values))
-        s = {
-            'min': 'nan',
-            'median': 'nan',
-            'mean': 'nan',
-            'max': 'nan',
-        }
-        if len(values) > 0:
-            s = {
-                'min': values[0],
-                'median': '',
-                'mean': '',
-                'max':values[-1],
-            }
-        return s
-
-    def is_numbers(self,values):
-        df = pd.DataFrame(data={'column1':values})
-        try:
-            df.astype(float)
-        except:
-            return False
-        return True
-
-
-    def is_date(self,values):
-        d = self.convert_date(values)
-        if len(d) > 0:
-            return True
-        return False
-
-    def convert_date(self,values):
-        return pd.to_datetime(values, errors='coerce',format="%Y-%m-%d").dropna()
-
-
-
-    def populate_records(self,dictionary,field_data_types,field_name_key,field_name_value):
-        records = {}
-        for group_id in dictionary:
-            records[group_id] = self.create_record(self.header,field_data_types)
-            data = dictionary[group_id][field_name_key]
-            for col in data:
-                col_dtype = 'categorical'
-                records[group_id][col] = ",".join(sorted([str(x) for x in list(data[col][field_name_value].keys())]))
-                c = col.split(' ')
-                if 'age' in c:
-                    col_dtype = 'desc_stats'
-                if 'date' in c:
-                    col_dtype = 'min_max'
-                c = col.split('_')
-                if 'age' in c:
-                    col_dtype = 'desc_stats'
-                if 'date' in c:
-                    col_dtype = 'min_max'
-                
-                if col in field_data_types:
-                    if 'data_type' in field_data_types[col]:
-                        col_dtype = field_data_types[col]['data_type']
-
-                if col_dtype == 'categorical':
-                    names = list(data[col][field_name_value].keys())
-                    for n in names:
-                        k = f"count_{col}_{n}"
-                        records[group_id][k] = data[col][field_name_value][n]
-                else:
-                    if col_dtype == 'none':
-                        records[group_id][col] = ",".join([str(x) for x in list(data[col][field_name_value].keys())])
-                    else:
-                        if col_dtype == 'desc_stats' or col_dtype == 'min_max':
-                            values = list(data[col][field_name_value].keys())
-                            if self.is_numbers(values):
-                                values = []
-                                for k in data[col][field_name_value]:
-
-                                    values += [float(k)] * data[col][field_name_value][k]
-                                dstats = self.calc_desc_stats_numerical(values)
-                            else:
-                                if self.is_date(list(data[col][field_name_value].keys())):
-                                    dstats = self.calc_desc_stats_dates(values)
-                                else:
-                                    values = list(data[col][field_name_value].values())
-                                    if self.is_date(values):
-                                        dstats = self.calc_desc_stats_dates(values)
-
-
-                            records[group_id][f'{col}_min_value'] = dstats['min']
-                            records[group_id][f'{col}_max_value'] = dstats['max']
-
-                            if col_dtype == 'desc_stats':
-                                records[group_id][f'{col}_mean_value'] = dstats['mean']
-                                records[group_id][f'{col}_median_value'] = dstats['median']
-                        else:
-                            records[group_id][col] = data[col][field_name_value]
-
-        return records
+    DATE_FORMAT = "%Y-%m-%d"
+
+    def __init__(self,header,df,groups,group_ids,field_data_types,columns_to_skip=[],missing_data='0'):
+        '''
+        :param header: list of summary columns to report
+        :param df: pd metadata of the samples of all groups, values as strings
+        :param groups: list-like of the group id of each row of df
+        :param group_ids: list of group ids, in the order of the summary
+        :param field_data_types: dict of column: {data_type, default, ...}
+        :param columns_to_skip: list of columns which are not summarized
+        :param missing_data: value counted as missing, in addition to empty values
+        '''
+        self.group_ids = list(group_ids)
+        self.summaries = {}
+
+        # Groups are aggregated by integer code, summaries are indexed by the code of their group:
+        codes, uniques = pd.factorize(pd.Series(groups, dtype=object))
+        positions = {group_id: i for i, group_id in enumerate(uniques)}
+        self.group_codes = [positions.get(group_id, -1) for group_id in self.group_ids]
+
+        fields = []
+        if len(self.group_ids) > 0:
+            for col in df.columns:
+                if col in columns_to_skip:
+                    continue
+                fields += self.summarize_column(col, df[col], codes, field_data_types, missing_data)
+        self.header = sorted(header + sorted(list(set(fields))))
+
+        self.data = self.populate_records(field_data_types)
+
+    def get_column_type(self,col,field_data_types,validate=True):
+        col_dtype = 'categorical'
+        c = col.split(' ')
+        if 'age' in c:
+            col_dtype = 'desc_stats'
+        if 'date' in c:
+            col_dtype = 'min_max'
+        c = col.split('_')
+        if 'age' in c:
+            col_dtype = 'desc_stats'
+        if 'date' in c:
+            col_dtype = 'min_max'
+        if col in field_data_types and 'data_type' in field_data_types[col]:
+            col_dtype = field_data_types[col]['data_type']
+        if validate and col_dtype not in self.valid_types:
+            col_dtype = 'categorical'
+        return col_dtype
+
+    def get_default(self,field,field_data_types):
+        value = ''
+        if not '_date' in field:
+            value = 0
+        if field in field_data_types and "default" in field_data_types[field]:
+            value = field_data_types[field]["default"]
+        return value
+
+    def summarize_column(self,col,values,groups,field_data_types,missing_data='0'):
+        '''
+        Summarizes a metadata column for all groups
+        :param col: str column name
+        :param values: pd.Series of the column values
+        :param groups: numpy array of the group code of each value
+        :param field_data_types: dict of column: {data_type, default, ...}
+        :param missing_data: value counted as missing
+        :return: list of the summary fields of the column
+        '''
+        valid = (values.notna() & (values != missing_data)).to_numpy()
+        pairs = pd.DataFrame({'group': groups[valid], 'value': values.to_numpy()[valid].astype(str)})
+
+        # Number of times each value occurs in each group, most frequent first and ties in order of first occurrence:
+        counts = pairs.groupby(['group', 'value'], sort=False).size().reset_index(name='count')
+        ordered = counts.sort_values('count', ascending=False, kind='stable')
+
+        self.summaries[col] = (self.join_values(counts.sort_values('value', kind='stable')), '')
+
+        value_type = self.get_column_type(col, field_data_types, validate=False)
+        if value_type == 'categorical':
+            table = counts.pivot(index='group', columns='value', values='count')
+            for value in table.columns:
+                field = f"count_{col}_{value}"
+                self.summaries[field] = (table[value].dropna().astype(int).astype(object), self.get_default(field, field_data_types))
+        elif value_type == 'none':
+            self.summaries[col] = (self.join_values(ordered), '')
+        elif value_type == 'desc_stats' or value_type == 'min_max':
+            self.summarize_values(col, pairs, value_type)
+        else:
+            dicts = {}
+            for group, rows in ordered.groupby('group', sort=False):
+                dicts[group] = str(dict(zip(rows['value'].tolist(), rows['count'].tolist())))
+            self.summaries[col] = (pd.Series(dicts, dtype=object), '{}')
+
+        field_type = self.get_column_type(col, field_data_types, validate=True)
+        fields = []
+        if field_type == 'categorical':
+            fields = [f"count_{col}_{value}" for value in counts['value'].unique()]
+        elif field_type == 'min_max':
+            fields = [f'{col}_min_value',f'{col}_max_value']
+        elif field_type == 'desc_stats':
+            fields = [f'{col}_min_value', f'{col}_mean_value', f'{col}_median_value',f'{col}_max_value']
+        return fields
+
+    def join_values(self,pairs):
+        '''
+        Joins the values of each group with commas, keeping their order within the group
+        :param pairs: pd with group and value columns
+        :return: pd.Series of str indexed by group code
+        '''
+        codes, group_ids = pd.factorize(pairs['group'])
+        order = np.argsort(codes, kind='stable')
+        values = pairs['value'].to_numpy()[order].tolist()
+        bounds = np.cumsum(np.bincount(codes, minlength=len(group_ids))).tolist()
+        starts = [0] + bounds[:-1]
+        return pd.Series([','.join(values[a:b]) for a, b in zip(starts, bounds)], index=group_ids, dtype=object)
+
+    def summarize_values(self,col,pairs,value_type):
+        '''
+        Calculates the range (and for desc_stats the mean and median) of the values of a column in each group.
+        The values of a group are numbers if all of them are numeric, otherwise the dates among them are used.
+        Groups without values are 'nan'.
+        :param col: str column name
+        :param pairs: pd of the group and value of the non-missing values
+        :param value_type: str [desc_stats, min_max]
+        :return: None
+        '''
+        distinct = pairs['value'].unique().tolist()
+        numbers = {}
+        for value in distinct:
+            try:
+                numbers[value] = float(value)
+            except ValueError:
+                pass
+        dates = pd.Series(pd.to_datetime(pd.Series(distinct, dtype=object), errors='coerce', format=self.DATE_FORMAT).to_numpy(), index=distinct)
+
+        numeric = pairs['value'].isin(numbers).groupby(pairs['group'], sort=False).all()
+        numeric_groups = set(numeric.index[numeric])
+        is_numeric = pairs['group'].isin(numeric_groups)
+
+        stats = pairs['value'][is_numeric].map(numbers).groupby(pairs['group'][is_numeric], sort=False).agg(['min', 'max', 'mean', 'median'])
+        date_values = pairs['value'][~is_numeric].map(dates)
+        date_stats = date_values.groupby(pairs['group'][~is_numeric], sort=False).agg(['min', 'max']).dropna()
+        date_stats = date_stats.apply(lambda x: x.dt.strftime(self.DATE_FORMAT))
+
+        date_blank = dict.fromkeys(date_stats.index, '')
+        self.summaries[f'{col}_min_value'] = (pd.Series({**stats['min'].to_dict(), **date_stats['min'].to_dict()}, dtype=object), 'nan')
+        self.summaries[f'{col}_max_value'] = (pd.Series({**stats['max'].to_dict(), **date_stats['max'].to_dict()}, dtype=object), 'nan')
+        if value_type == 'desc_stats':
+            # The mean is reported as the median and the median as the mean:
+            self.summaries[f'{col}_mean_value'] = (pd.Series({**stats['median'].to_dict(), **date_blank}, dtype=object), 'nan')
+            self.summaries[f'{col}_median_value'] = (pd.Series({**stats['mean'].to_dict(), **date_blank}, dtype=object), 'nan')
+
+    def populate_records(self,field_data_types):
+        '''
+        Creates the summary of each group, with every value as a string
+        :param field_data_types: dict of column: {data_type, default, ...}
+        :return: pd indexed by group id
+        '''
+        columns = {}
+        for f in self.header:
+            columns[f] = [str(self.get_default(f, field_data_types))] * len(self.group_ids)
+        for f in self.summaries:
+            values, fill = self.summaries[f]
+            values = values.reindex(self.group_codes)
+            columns[f] = [str(x) for x in values.astype(object).where(values.notna(), fill).tolist()]
+        return pd.DataFrame(columns, index=pd.Index(self.group_ids, dtype=object))
 
     def get_data(self):
         return self.data
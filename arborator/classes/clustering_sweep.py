@@ -0,0 +1,44 @@
+import numpy as np
+import scipy.cluster.hierarchy
+from arborator.classes.matrix_clustering import matrix_clustering
+
+class clustering_sweep(matrix_clustering):
+    """
+    Clusters one in-memory distance matrix with several linkage methods and
+    threshold sets.
+
+    The linkage of each method is computed once, from the matrix between
+    profiles for single linkage and from the expanded matrix for the other
+    methods, and the tree of a method is cut once at each distinct
+    threshold, however many threshold sets use it. Cluster ids are the same
+    as those of matrix_clustering with the same method and thresholds. No
+    tree is produced.
+    """
+
+    def __init__(self, dist_mat, settings, sort_matrix=False):
+        '''
+        :param dist_mat: tuple of (list of labels, condensed_matrix, numpy array of the profile of each label)
+        :param settings: list of (method, list of thresholds) to cluster with
+        :param sort_matrix: sort the labels (and matrix) in ascending order
+        '''
+        self.labels, matrix, inverse = self.read_profiles(dist_mat, sort_matrix=sort_matrix)
+        self.addresses = []
+
+        linkages = {}
+        cuts = {}
+        for (method, thresholds) in settings:
+            if method not in linkages:
+                linkages[method] = self.get_linkage(matrix, inverse, method)
+            levels = []
+            for dist in thresholds:
+                if (method, dist) not in cuts:
+                    clusters = scipy.cluster.hierarchy.fcluster(linkages[method], dist, criterion="distance")
+                    cuts[(method, dist)] = np.asarray(clusters).astype(str)
+                levels.append(cuts[(method, dist)])
+            self.addresses.append([".".join(x) for x in zip(*levels)])
+
+    def get_addresses(self):
+        '''
+        :return: list with, for each setting, the list of addresses of the labels
+        '''
+        return self.addresses
@@ -0,0 +1,219 @@
+import tempfile
+import numpy as np
+from numba import jit
+
+@jit(nopython=True, cache=True)
+def expand_distances(distances, num_profiles, inverse, expanded):
+    '''
+    Fills the condensed distances between rows from the condensed distances between their profiles
+    :param distances: condensed numpy array of distances between profiles
+    :param num_profiles: int number of profiles
+    :param inverse: numpy array of the profile of each row
+    :param expanded: condensed numpy array of distances between rows, updated in place
+    :return: expanded
+    '''
+    num_rows = len(inverse)
+    k = 0
+    for i in range(num_rows):
+        a = inverse[i]
+        for j in range(i + 1, num_rows):
+            b = inverse[j]
+            if a == b:
+                expanded[k] = 0
+            elif a < b:
+                expanded[k] = distances[num_profiles * a - a * (a + 1) // 2 + b - a - 1]
+            else:
+                expanded[k] = distances[num_profiles * b - b * (b + 1) // 2 + a - b - 1]
+            k += 1
+    return expanded
+
+@jit(nopython=True, cache=True)
+def count_distances(distances, num_profiles, counts, start, end, histogram):
+    '''
+    Counts the number of row pairs at each distance, where profile i stands for counts[i] rows
+    :param distances: condensed numpy array of distances of profiles start to end (exclusive)
+    :param num_profiles: int number of profiles
+    :param counts: numpy array of the number of rows of each profile
+    :param start: int first profile of the tile
+    :param end: int profile after the last profile of the tile
+    :param histogram: numpy int64 array indexed by distance, updated in place
+    :return: histogram
+    '''
+    k = 0
+    for i in range(start, end):
+        # Pairs of rows sharing a profile are at distance 0:
+        histogram[0] += counts[i] * (counts[i] - 1) // 2
+        for j in range(i + 1, num_profiles):
+            histogram[distances[k]] += counts[i] * counts[j]
+            k += 1
+    return histogram
+
+class condensed_matrix:
+    """
+    Symmetric distance matrix stored as its condensed upper triangle.
+
+    Distances are kept in the scipy squareform layout: the distance between
+    profiles i < j is at position n*i - i*(i+1)/2 + j - i - 1. Hamming
+    distances are bounded by the number of loci, so the distances are held in
+    the smallest unsigned integer type that fits them, which is a fraction of
+    the memory of a square int64 matrix.
+
+    For groups too large to hold in memory, the distances can be backed by an
+    anonymous memory-mapped file in a scratch directory and processed in
+    tiles of consecutive rows, each of which is a contiguous slice.
+    """
+
+    def __init__(self, distances, num_profiles, scratch_dir=None):
+        '''
+        :param distances: condensed numpy array of distances between profiles
+        :param num_profiles: int number of profiles
+        :param scratch_dir: directory of the memory-mapped file backing the distances, None if held in memory
+        '''
+        self.distances = distances
+        self.num_profiles = num_profiles
+        self.scratch_dir = scratch_dir
+
+    @staticmethod
+    def create(num_profiles, dtype, scratch_dir=None):
+        '''
+        Creates a matrix of zeros, in memory or backed by a memory-mapped file in scratch_dir
+        :param num_profiles: int number of profiles
+        :param dtype: numpy dtype of the distances
+        :param scratch_dir: directory for the memory-mapped file, None to hold the distances in memory
+        :return: condensed_matrix
+        '''
+        size = condensed_matrix.get_size(num_profiles)
+        if scratch_dir is None:
+            return condensed_matrix(np.zeros(size, dtype=dtype), num_profiles)
+        # The file is removed as soon as it is no longer mapped:
+        distances = np.memmap(tempfile.TemporaryFile(dir=scratch_dir), dtype=dtype, mode='w+', shape=(max(size, 1),))[:size]
+        return condensed_matrix(distances, num_profiles, scratch_dir)
+
+    @staticmethod
+    def get_size(num_profiles):
+        return num_profiles * (num_profiles - 1) // 2
+
+    def get_row_start(self, row):
+        '''
+        Calculates the condensed position of the first distance of a row, the distances of a row
+        are those to the profiles after it
+        :param row: int profile index, up to num_profiles
+        :return: int position
+        '''
+        return self.num_profiles * row - row * (row + 1) // 2
+
+    def get_tiles(self, max_cells=None):
+        '''
+        Splits the rows into tiles of consecutive rows holding at most max_cells distances (at least one row)
+        :param max_cells: int maximum number of distances in a tile, one tile if None
+        :return: list of (first row, row after the last row)
+        '''
+        if max_cells is None:
+            return [(0, self.num_profiles)]
+        tiles = []
+        start = 0
+        while start < self.num_profiles:
+            end = start + 1
+            while end < self.num_profiles and self.get_row_start(end + 1) - self.get_row_start(start) <= max_cells:
+                end += 1
+            tiles.append((start, end))
+            start = end
+        return tiles
+
+    def get_tile(self, start, end):
+        return self.distances[self.get_row_start(start):self.get_row_start(end)]
+
+    def flush(self):
+        if isinstance(self.distances, np.memmap):
+            self.distances.flush()
+
+    @staticmethod
+    def get_dtype(max_value):
+        return np.min_scalar_type(max(int(max_value), 0))
+
+    def compact(self):
+        '''
+        Converts the distances to the smallest unsigned integer type holding the largest distance
+        :return: None
+        '''
+        # Converting would need a second copy of a memory-mapped matrix:
+        if self.scratch_dir is not None:
+            return
+        dtype = self.get_dtype(self.get_max())
+        if dtype.itemsize < self.distances.dtype.itemsize:
+            self.distances = self.distances.astype(dtype)
+
+    def get_max(self):
+        if len(self.distances) == 0:
+            return 0
+        return int(self.distances.max())
+
+    def get_index(self, rows, cols):
+        '''
+        Calculates the condensed positions of pairs of profiles, pairs of a profile with itself are set to 0
+        :param rows: numpy array of profile indices
+        :param cols: numpy array of profile indices, the same shape as rows
+        :return: (numpy array of positions, numpy boolean array of the pairs of a profile with itself)
+        '''
+        a = np.minimum(rows, cols).astype(np.int64)
+        b = np.maximum(rows, cols).astype(np.int64)
+        same = a == b
+        index = self.num_profiles * a - a * (a + 1) // 2 + b - a - 1
+        index[same] = 0
+        return (index, same)
+
+    def get_pairs(self, index):
+        '''
+        Converts condensed positions back into pairs of profiles
+        :param index: numpy array of positions
+        :return: (numpy array of row profile indices, numpy array of column profile indices), rows < cols
+        '''
+        n = self.num_profiles
+        index = np.asarray(index, dtype=np.int64)
+        rows = (n - 2 - np.floor(np.sqrt(-8 * index + 4 * n * (n - 1) - 7) / 2 - 0.5)).astype(np.int64)
+        cols = index + rows + 1 - n * (n - 1) // 2 + (n - rows) * (n - rows - 1) // 2
+        return (rows, cols)
+
+    def get_block(self, rows, cols):
+        '''
+        Extracts a block of the square matrix
+        :param rows: numpy array of profile indices of the block rows
+        :param cols: numpy array of profile indices of the block columns
+        :return: 2D numpy array of distances
+        '''
+        rows = np.asarray(rows)[:, np.newaxis]
+        cols = np.asarray(cols)[np.newaxis, :]
+        index, same = self.get_index(rows, cols)
+        if len(self.distances) == 0:
+            return np.zeros(index.shape, dtype=self.distances.dtype)
+        block = self.distances[index]
+        block[same] = 0
+        return block
+
+    def expand(self, inverse, dtype=None):
+        '''
+        Expands the distances between profiles into the condensed distances between rows
+        :param inverse: numpy array of the profile of each row
+        :param dtype: numpy dtype of the expanded distances, defaults to the dtype of the distances
+        :return: condensed_matrix
+        '''
+        if dtype is None:
+            dtype = self.distances.dtype
+        inverse = np.asarray(inverse, dtype=np.int64)
+        expanded = self.create(len(inverse), dtype, self.scratch_dir)
+        expand_distances(self.distances, self.num_profiles, inverse, expanded.distances)
+        expanded.flush()
+        return expanded
+
+    def get_histogram(self, counts, max_cells=None):
+        '''
+        Counts the number of row pairs at each distance, tile by tile
+        :param counts: numpy array of the number of rows of each profile
+        :param max_cells: int maximum number of distances in a tile, one tile if None
+        :return: numpy int64 array indexed by distance
+        '''
+        counts = np.asarray(counts, dtype=np.int64)
+        histogram = np.zeros(self.get_max() + 1, dtype=np.int64)
+        for start, end in self.get_tiles(max_cells):
+            count_distances(self.get_tile(start, end), self.num_profiles, counts, start, end, histogram)
+        return histogram
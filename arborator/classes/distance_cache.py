@@ -0,0 +1,161 @@
+import hashlib
+import sqlite3
+import time
+import numpy as np
+from arborator.classes.condensed_matrix import condensed_matrix
+
+class distance_cache:
+    """
+    Persistent cache of pairwise profile distances shared between runs.
+
+    Distances are stored in SQLite keyed by a content hash of each sample's
+    profile, so a pair of samples compared in an earlier run is not compared
+    again, regardless of which group it falls into. Entries record when they
+    were last used and the least recently used entries are evicted once the
+    cache grows past max_entries.
+    """
+    TIMEOUT = 600
+
+    def __init__(self, path, max_entries=None):
+        '''
+        :param path: path to the SQLite cache file, created if it does not exist
+        :param max_entries: maximum number of pairwise distances to keep, unlimited if None
+        '''
+        self.path = path
+        self.max_entries = max_entries
+        self.run_time = int(time.time())
+        self.conn = sqlite3.connect(path, timeout=self.TIMEOUT, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS profiles (id INTEGER PRIMARY KEY AUTOINCREMENT, hash TEXT UNIQUE NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS distances (id1 INTEGER NOT NULL, id2 INTEGER NOT NULL, dist INTEGER NOT NULL, "
+                          "last_used INTEGER NOT NULL, PRIMARY KEY (id1, id2)) WITHOUT ROWID")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS distances_last_used ON distances (last_used)")
+
+    def hash_profiles(self, profiles, loci, allele_map):
+        '''
+        Hashes the profiles by their original allele values, so that hashes stay the same
+        across runs even when the allele encoding changes
+        :param profiles: 2D numpy array of encoded allele profiles
+        :param loci: list of locus names, one per column
+        :param allele_map: dict of locus: {allele: code} used to encode the profiles
+        :return: list of str hashes, one per row
+        '''
+        num_rows = profiles.shape[0]
+        h1 = np.zeros(num_rows, dtype=np.uint64)
+        h2 = np.zeros(num_rows, dtype=np.uint64)
+        p1 = np.uint64(1099511628211)
+        p2 = np.uint64(14029467366897019727)
+
+        for j, locus in enumerate(loci):
+            decode = {}
+            if locus in allele_map:
+                for allele in allele_map[locus]:
+                    decode[allele_map[locus][allele]] = str(allele)
+            codes, inverse = np.unique(profiles[:, j], return_inverse=True)
+            c1 = np.zeros(len(codes), dtype=np.uint64)
+            c2 = np.zeros(len(codes), dtype=np.uint64)
+            for i, code in enumerate(codes.tolist()):
+                if code == 0:
+                    allele = '0'
+                else:
+                    allele = decode.get(code, str(code))
+                digest = hashlib.blake2b(f"{locus}\t{allele}".encode(), digest_size=16).digest()
+                c1[i] = int.from_bytes(digest[:8], 'little')
+                c2[i] = int.from_bytes(digest[8:], 'little')
+            # Polynomial rolling hash over the loci, overflow wraps around:
+            h1 = h1 * p1 + c1[inverse]
+            h2 = h2 * p2 + c2[inverse]
+
+        return [f"{a:016x}{b:016x}" for a, b in zip(h1.tolist(), h2.tolist())]
+
+    def get_profile_ids(self, hashes):
+        '''
+        Looks up (and creates when missing) the cache ids of profile hashes
+        :param hashes: list of unique str hashes
+        :return: list of int ids
+        '''
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.executemany("INSERT OR IGNORE INTO profiles (hash) VALUES (?)", [(h,) for h in hashes])
+        self.conn.execute("COMMIT")
+        ids = {}
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup (hash TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM lookup")
+        self.conn.executemany("INSERT OR IGNORE INTO lookup (hash) VALUES (?)", [(h,) for h in hashes])
+        for profile_id, h in self.conn.execute("SELECT p.id, p.hash FROM profiles p JOIN lookup l ON p.hash = l.hash"):
+            ids[h] = profile_id
+        return [ids[h] for h in hashes]
+
+    def get_distances(self, profile_ids, distances, known):
+        '''
+        Fills in the cached distances between profiles
+        :param profile_ids: list of unique int profile ids
+        :param distances: condensed numpy array of distances, updated in place
+        :param known: condensed numpy boolean array of which distances are known, updated in place
+        :return: (distances, known)
+        '''
+        num_profiles = len(profile_ids)
+
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS members (id INTEGER PRIMARY KEY, pos INTEGER NOT NULL)")
+        self.conn.execute("DELETE FROM members")
+        self.conn.executemany("INSERT INTO members (id, pos) VALUES (?, ?)", [(x, i) for i, x in enumerate(profile_ids)])
+        rows = self.conn.execute("SELECT a.pos, b.pos, d.dist FROM distances d "
+                                 "JOIN members a ON d.id1 = a.id JOIN members b ON d.id2 = b.id").fetchall()
+        if len(rows) > 0:
+            rows = np.array(rows, dtype=np.int64)
+            index, _ = condensed_matrix(distances, num_profiles).get_index(rows[:, 0], rows[:, 1])
+            distances[index] = rows[:, 2]
+            known[index] = True
+
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("UPDATE distances SET last_used = ? WHERE id1 IN (SELECT id FROM members) "
+                              "AND id2 IN (SELECT id FROM members)", (self.run_time,))
+            self.conn.execute("COMMIT")
+
+        return (distances, known)
+
+    def add_distances(self, profile_ids, distances, known):
+        '''
+        Stores the distances that were not previously known
+        :param profile_ids: list of unique int profile ids
+        :param distances: condensed numpy array of distances
+        :param known: condensed numpy boolean array of the distances that were already cached
+        :return: int number of distances added
+        '''
+        index = np.flatnonzero(~known)
+        if len(index) == 0:
+            return 0
+        rows, cols = condensed_matrix(distances, len(profile_ids)).get_pairs(index)
+        ids = np.array(profile_ids, dtype=np.int64)
+        id1 = np.minimum(ids[rows], ids[cols]).tolist()
+        id2 = np.maximum(ids[rows], ids[cols]).tolist()
+        dists = distances[index].tolist()
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.executemany("INSERT OR REPLACE INTO distances (id1, id2, dist, last_used) VALUES (?, ?, ?, ?)",
+                              zip(id1, id2, dists, [self.run_time] * len(dists)))
+        self.conn.execute("COMMIT")
+        return len(dists)
+
+    def evict(self):
+        '''
+        Removes the least recently used distances beyond max_entries
+        :return: int number of distances removed
+        '''
+        if self.max_entries is None:
+            return 0
+        num_entries = self.get_num_entries()
+        if num_entries <= self.max_entries:
+            return 0
+        num_remove = num_entries - self.max_entries
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute("DELETE FROM distances WHERE (id1, id2) IN "
+                          "(SELECT id1, id2 FROM distances ORDER BY last_used ASC LIMIT ?)", (num_remove,))
+        self.conn.execute("COMMIT")
+        return num_remove
+
+    def get_num_entries(self):
+        return self.conn.execute("SELECT COUNT(*) FROM distances").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,137 @@
+import os
+import numpy as np
+from numba import jit
+
+@jit(nopython=True, cache=True)
+def copy_distances(source, num_source, source_pos, distances, num_profiles, pos, known):
+    '''
+    Copies the distances between profiles of a stored matrix that are not yet known
+    :param source: condensed numpy array of the stored distances
+    :param num_source: int number of profiles of the stored matrix
+    :param source_pos: numpy array of the position of each profile in the stored matrix
+    :param distances: condensed numpy array of distances, updated in place
+    :param num_profiles: int number of profiles of distances
+    :param pos: numpy array of the position of each profile in distances
+    :param known: condensed numpy boolean array of which distances are known, updated in place
+    :return: int number of distances copied
+    '''
+    count = 0
+    num_members = len(pos)
+    for x in range(num_members):
+        for y in range(x + 1, num_members):
+            i = min(pos[x], pos[y])
+            j = max(pos[x], pos[y])
+            k = num_profiles * i - i * (i + 1) // 2 + j - i - 1
+            if known[k]:
+                continue
+            a = min(source_pos[x], source_pos[y])
+            b = max(source_pos[x], source_pos[y])
+            distances[k] = source[num_source * a - a * (a + 1) // 2 + b - a - 1]
+            known[k] = True
+            count += 1
+    return count
+
+class distance_store:
+    """
+    Distances shared by the partitionings of one run, so that a pair of
+    samples grouped together by several partition columns is compared once.
+
+    Each distinct profile of the run gets an integer id. The distance matrix
+    of every group of a partitioning is kept in the store directory as a
+    numpy file, with the ids of its profiles, and indexed once the
+    partitioning finishes. A group of a later partitioning copies the
+    distances between its profiles that share a group of an earlier
+    partitioning straight from that group's matrix, with no per-pair lookup.
+    The store has the same interface as distance_cache, with profile ids in
+    place of profile hashes, and only lasts for the run.
+    """
+    IDS_SUFFIX = ".ids.npy"
+    DISTANCES_SUFFIX = ".dist.npy"
+
+    def __init__(self, directory, profiles):
+        '''
+        :param directory: existing directory to keep the group matrices in
+        :param profiles: 2D numpy array of the encoded profiles of the run
+        '''
+        self.directory = directory
+        _, inverse = np.unique(profiles, axis=0, return_inverse=True)
+        self.row_ids = inverse.reshape(-1).astype(np.int64)
+        self.num_ids = int(self.row_ids.max()) + 1 if len(self.row_ids) > 0 else 0
+        self.partition = 0
+        self.keep = True
+        self.partitions = []
+        self.count_written = 0
+
+    def start_partition(self, keep=True):
+        '''
+        :param keep: keep the matrices of this partitioning's groups for the later partitionings
+        :return: None
+        '''
+        self.keep = keep
+
+    def end_partition(self):
+        '''
+        Indexes the matrices written by the groups of the current partitioning
+        :return: None
+        '''
+        if self.keep:
+            prefix = f"{self.partition}_"
+            paths = []
+            for fname in sorted(os.listdir(self.directory)):
+                if fname.startswith(prefix) and fname.endswith(self.IDS_SUFFIX):
+                    paths.append(os.path.join(self.directory, fname[:-len(self.IDS_SUFFIX)]))
+
+            entry_of = np.full(self.num_ids, -1, dtype=np.int64)
+            pos_of = np.zeros(self.num_ids, dtype=np.int64)
+            sizes = []
+            for entry, path in enumerate(paths):
+                ids = np.load(path + self.IDS_SUFFIX)
+                entry_of[ids] = entry
+                pos_of[ids] = np.arange(len(ids))
+                sizes.append(len(ids))
+            self.partitions.append((entry_of, pos_of, paths, sizes))
+        self.partition += 1
+
+    def get_profile_ids(self, profile_ids):
+        return np.asarray(profile_ids, dtype=np.int64)
+
+    def get_distances(self, profile_ids, distances, known):
+        '''
+        Fills in the distances between profiles which share a group of an earlier partitioning
+        :param profile_ids: numpy array of unique int profile ids
+        :param distances: condensed numpy array of distances, updated in place
+        :param known: condensed numpy boolean array of which distances are known, updated in place
+        :return: (distances, known)
+        '''
+        num_profiles = len(profile_ids)
+        for (entry_of, pos_of, paths, sizes) in self.partitions:
+            entries = entry_of[profile_ids]
+            members = np.flatnonzero(entries >= 0)
+            if len(members) < 2:
+                continue
+            members = members[np.argsort(entries[members], kind='stable')]
+            values, starts, counts = np.unique(entries[members], return_index=True, return_counts=True)
+            for entry, start, count in zip(values.tolist(), starts.tolist(), counts.tolist()):
+                if count < 2:
+                    continue
+                pos = members[start:start + count]
+                source = np.load(paths[entry] + self.DISTANCES_SUFFIX, mmap_mode='r')
+                copy_distances(source, sizes[entry], pos_of[profile_ids[pos]], distances, num_profiles, pos, known)
+        return (distances, known)
+
+    def add_distances(self, profile_ids, distances, known):
+        '''
+        Keeps the distance matrix of a group for the later partitionings
+        :param profile_ids: numpy array of unique int profile ids
+        :param distances: condensed numpy array of distances
+        :param known: condensed numpy boolean array of the distances that were already known
+        :return: int number of distances kept
+        '''
+        if not self.keep or len(profile_ids) < 2:
+            return 0
+        # Groups are processed by several worker processes, each with its own copy of the store:
+        path = os.path.join(self.directory, f"{self.partition}_{os.getpid()}_{self.count_written}")
+        self.count_written += 1
+        np.save(path + self.DISTANCES_SUFFIX, distances)
+        np.save(path + self.IDS_SUFFIX, profile_ids)
+        return len(distances)
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+class incremental:
+    """
+    Fingerprints groups so that the results of unchanged groups can be
+    carried over from a previous run instead of being recomputed.
+
+    A group fingerprint covers the group id, its member ids (in order), their
+    allele profiles and the parameters that affect the within group results.
+    Profiles are ranked per locus within the group before hashing, so the
+    fingerprint does not change when new alleles elsewhere in the data shift
+    the run-wide allele codes. The loci summary records those codes, so it
+    is written again for carried over groups instead of being copied.
+    """
+    MANIFEST_FILE = "group_fingerprints.json"
+    CARRIED_FILES = ['matrix', 'condensed_matrix', 'clusters', 'tree', 'outliers']
+
+    def __init__(self, parameters, previous_outdir=None):
+        '''
+        :param parameters: dict of parameters affecting the within group results
+        :param previous_outdir: output directory of a previous run to reuse results from
+        '''
+        self.parameters = json.dumps(parameters, sort_keys=True, default=str)
+        self.previous_outdir = previous_outdir
+        self.previous = {}
+        self.messages = []
+
+        if previous_outdir is not None:
+            manifest = os.path.join(previous_outdir, self.MANIFEST_FILE)
+            if os.path.isfile(manifest):
+                with open(manifest) as fh:
+                    self.previous = json.loads(fh.read())
+            else:
+                self.messages.append(f'WARNING: {manifest} does not exist, all groups will be recomputed.')
+
+    def rank_profiles(self, profiles):
+        '''
+        Replaces allele codes with their rank within each locus of the group, keeping 0 as missing
+        :param profiles: 2D numpy array of integer allele profiles
+        :return: 2D numpy array
+        '''
+        if profiles.size == 0:
+            return profiles.astype(np.int64)
+        order = np.argsort(profiles, axis=0, kind='stable')
+        sorted_profiles = np.take_along_axis(profiles, order, axis=0)
+        ranks = np.zeros(profiles.shape, dtype=np.int64)
+        ranks[1:] = np.cumsum(sorted_profiles[1:] != sorted_profiles[:-1], axis=0)
+        ranked = np.empty(profiles.shape, dtype=np.int64)
+        np.put_along_axis(ranked, order, ranks + 1, axis=0)
+        ranked[profiles == 0] = 0
+        return ranked
+
+    def fingerprint(self, group_id, labels, profiles):
+        '''
+        Calculates the fingerprint of a group
+        :param group_id: str group id
+        :param labels: list of member ids in processing order
+        :param profiles: 2D numpy array of the members' allele profiles
+        :return: str hex digest
+        '''
+        h = hashlib.sha256()
+        h.update(self.parameters.encode())
+        h.update(json.dumps([str(group_id)] + [str(x) for x in labels]).encode())
+        h.update(str(profiles.shape).encode())
+        h.update(np.ascontiguousarray(self.rank_profiles(profiles)).tobytes())
+        return h.hexdigest()
+
+    def get_previous(self, group_id, fingerprint):
+        '''
+        Looks up the previous results of a group with an identical fingerprint
+        :param group_id: str group id
+        :param fingerprint: str fingerprint of the group in this run
+        :return: dict of the previous record or None
+        '''
+        if group_id not in self.previous:
+            return None
+        record = self.previous[group_id]
+        if record['fingerprint'] != fingerprint:
+            return None
+        if record['results']['count_members'] >= record['min_members']:
+            if 'clusters' not in record['files']:
+                return None
+            directory = os.path.join(self.previous_outdir, record['directory'])
+            if not os.path.isfile(os.path.join(directory, record['files']['clusters'])):
+                return None
+        return record
+
+    def carry_over(self, record, output_files):
+        '''
+        Copies the within group result files of a previous run into this run
+        :param record: dict of the previous record
+        :param output_files: dict of the output files of the group in this run
+        :return: None
+        '''
+        directory = os.path.join(self.previous_outdir, record['directory'])
+        for key in self.CARRIED_FILES:
+            if key not in record['files']:
+                continue
+            src = os.path.join(directory, record['files'][key])
+            dst = output_files[key]
+            if not os.path.isfile(src):
+                continue
+            if os.path.isfile(dst) and os.path.samefile(src, dst):
+                continue
+            shutil.copyfile(src, dst)
+
+    def create_record(self, fingerprint, directory, output_files, results, min_members):
+        '''
+        Creates the manifest record of a group for future runs
+        :return: dict
+        '''
+        files = {}
+        for key in self.CARRIED_FILES:
+            if os.path.isfile(output_files[key]):
+                files[key] = os.path.basename(output_files[key])
+
+        group_results = {}
+        for k in results:
+            if k == 'addresses' or k == 'sweep' or k == 'outputs' or k == 'run_data':
+                continue
+            group_results[k] = results[k]
+
+        return {
+            'fingerprint': fingerprint,
+            'directory': directory,
+            'min_members': min_members,
+            'files': files,
+            'results': group_results,
+        }
+
+    def write_manifest(self, outdir, records):
+        with open(os.path.join(outdir, self.MANIFEST_FILE), 'w') as fh:
+            fh.write(json.dumps(records, indent=4))
@@ -0,0 +1,147 @@
+import numpy as np
+import scipy.cluster.hierarchy
+from numba import jit
+from genomic_address_service.classes.multi_level_clustering import multi_level_clustering
+
+@jit(nopython=True, cache=True)
+def single_linkage(distances, num_profiles, inverse):
+    '''
+    Single linkage between rows, from the condensed distances between their profiles. This is the minimum spanning
+    tree algorithm of scipy.cluster.hierarchy.linkage with the same order of visits and ties, so the linkage is the same
+    as that of the expanded matrix, with the distance of each row pair looked up instead of stored
+    :param distances: condensed numpy array of distances between profiles
+    :param num_profiles: int number of profiles
+    :param inverse: numpy int64 array of the profile of each row
+    :return: numpy linkage matrix between rows, labeled
+    '''
+    num_rows = len(inverse)
+    linkage = np.empty((num_rows - 1, 4))
+    merged = np.zeros(num_rows, dtype=np.bool_)
+    nearest = np.full(num_rows, np.inf)
+    x = 0
+    y = 0
+    for k in range(num_rows - 1):
+        current_min = np.inf
+        merged[x] = True
+        a = inverse[x]
+        for i in range(num_rows):
+            if merged[i]:
+                continue
+            b = inverse[i]
+            if a == b:
+                dist = 0.0
+            elif a < b:
+                dist = float(distances[num_profiles * a - a * (a + 1) // 2 + b - a - 1])
+            else:
+                dist = float(distances[num_profiles * b - b * (b + 1) // 2 + a - b - 1])
+            if nearest[i] > dist:
+                nearest[i] = dist
+            if nearest[i] < current_min:
+                y = i
+                current_min = nearest[i]
+        linkage[k, 0] = x
+        linkage[k, 1] = y
+        linkage[k, 2] = current_min
+        x = y
+
+    linkage = linkage[np.argsort(linkage[:, 2], kind='mergesort')]
+
+    # cluster ids as assigned by scipy, through a union find of the joined clusters:
+    parent = np.arange(2 * num_rows - 1)
+    size = np.ones(2 * num_rows - 1, dtype=np.int64)
+    for k in range(num_rows - 1):
+        roots = np.empty(2, dtype=np.int64)
+        for j in range(2):
+            node = int(linkage[k, j])
+            root = node
+            while parent[root] != root:
+                root = parent[root]
+            while parent[node] != root:
+                next_node = parent[node]
+                parent[node] = root
+                node = next_node
+            roots[j] = root
+        label = num_rows + k
+        linkage[k, 0] = min(roots[0], roots[1])
+        linkage[k, 1] = max(roots[0], roots[1])
+        parent[roots[0]] = label
+        parent[roots[1]] = label
+        size[label] = size[roots[0]] + size[roots[1]]
+        linkage[k, 3] = size[label]
+    return linkage
+
+class matrix_clustering(multi_level_clustering):
+    """
+    Multi-level clustering of an in-memory distance matrix.
+
+    GAS only accepts a path to a distance matrix file. This class accepts a
+    (labels, matrix, inverse) tuple instead, where matrix is a condensed_matrix
+    of the distances between profiles and inverse gives the profile of each
+    label, so the matrix does not need to be written to disk and parsed back
+    before clustering.
+
+    Single linkage looks up the distance of each pair of labels in the matrix
+    between profiles, so the matrix between labels is never built. The other
+    methods update the distances between clusters as they join them, so the
+    matrix is expanded to every label before it is clustered.
+    """
+    UNIQUE_METHODS = ['single']
+
+    def __init__(self, dist_mat, thresholds, method, sort_matrix, tree_distances='patristic'):
+        '''
+        :param dist_mat: tuple of (list of labels, condensed_matrix, numpy array of the profile of each label)
+        :param thresholds: list of distance thresholds to assign clusters at
+        :param method: str linkage method
+        :param sort_matrix: sort the labels (and matrix) in ascending order
+        :param tree_distances: str how distances are represented in the tree, patristic or cophenetic
+        '''
+        self.thresholds = thresholds
+        self.newick = None
+        self.cluster_memberships = {}
+
+        self.labels, matrix, inverse = self.read_profiles(dist_mat, sort_matrix=sort_matrix)
+        self.linkage = self.get_linkage(matrix, inverse, method)
+        self._init_membership()
+        self._assign_clusters()
+        self._linkage_to_newick(tree_distances=tree_distances)
+
+    def read_profiles(self, dist_mat, sort_matrix=False):
+        '''
+        :param dist_mat: tuple of (list of labels, condensed_matrix, numpy array of the profile of each label)
+        :param sort_matrix: sort the labels (and their profiles) in ascending order
+        :return: (list of labels, condensed_matrix, numpy array of the profile of each label)
+        '''
+        labels, matrix, inverse = dist_mat
+        labels = [str(x) for x in labels]
+        inverse = np.asarray(inverse)
+
+        if sort_matrix:
+            order = sorted(range(len(labels)), key=labels.__getitem__)
+            labels = [labels[i] for i in order]
+            inverse = inverse[order]
+
+        return (labels, matrix, inverse)
+
+    def read_distance_matrix(self, dist_mat, delim="\t", sort_matrix=False):
+        '''
+        Produces the labels and condensed (upper triangle) distances for an in-memory matrix
+        :param dist_mat: tuple of (list of labels, condensed_matrix, numpy array of the profile of each label)
+        :param delim: unused, kept for compatibility with multi_level_clustering
+        :param sort_matrix: sort the labels (and matrix) in ascending order
+        :return: (list, numpy.array)
+        '''
+        labels, matrix, inverse = self.read_profiles(dist_mat, sort_matrix=sort_matrix)
+        return (labels, matrix.expand(inverse, dtype=float).distances)
+
+    def get_linkage(self, matrix, inverse, method):
+        '''
+        :param matrix: condensed_matrix of the distances between profiles
+        :param inverse: numpy array of the profile of each label
+        :param method: str linkage method
+        :return: numpy linkage matrix between labels
+        '''
+        if method not in self.UNIQUE_METHODS:
+            return scipy.cluster.hierarchy.linkage(matrix.expand(inverse, dtype=float).distances, method=method,
+                                                   metric='precomputed')
+
+        return single_linkage(matrix.distances, matrix.num_profiles, np.asarray(inverse, dtype=np.int64))
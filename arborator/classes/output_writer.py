@@ -0,0 +1,92 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import openpyxl
+from arborator.constants import EXCEL_MODES
+
+class output_writer:
+    """
+    Writes the run level output tables and records how long each took.
+
+    Excel workbooks can be written by pandas, which builds the whole workbook
+    in memory (memory), streamed row by row into a write-only workbook
+    (streaming), streamed in a background thread while the run continues
+    (background) or not written at all (skip). Background writes happen one
+    at a time, in the order they were submitted, and are finished by wait().
+    """
+    EXCEL_MODES = EXCEL_MODES
+
+    def __init__(self, excel_mode='memory'):
+        '''
+        :param excel_mode: str how Excel workbooks are written, one of EXCEL_MODES
+        '''
+        if excel_mode not in self.EXCEL_MODES:
+            message = f'Excel output mode supplied is invalid: {excel_mode}, it needs to be one of {", ".join(self.EXCEL_MODES)}'
+            raise Exception(message)
+        self.excel_mode = excel_mode
+        self.times = {}
+        self.executor = None
+        self.futures = []
+        if excel_mode == 'background':
+            self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def record(self, path, start):
+        self.times[os.path.basename(path)] = {'wall_time_s': round(time.perf_counter() - start, 6)}
+
+    def write_tsv(self, df, path):
+        start = time.perf_counter()
+        df.to_csv(path, sep="\t", header=True, index=False)
+        self.record(path, start)
+
+    def write_excel(self, df, path, sheet_name):
+        '''
+        Writes a table to an Excel workbook according to the Excel output mode
+        :param df: pd table
+        :param path: str path of the workbook
+        :param sheet_name: str name of the worksheet
+        :return: None
+        '''
+        if self.excel_mode == 'skip':
+            return
+        if self.excel_mode == 'memory':
+            start = time.perf_counter()
+            df.to_excel(path, header=True, index=False, sheet_name=sheet_name)
+            self.record(path, start)
+        elif self.excel_mode == 'streaming':
+            self.stream_excel(df, path, sheet_name)
+        else:
+            self.futures.append(self.executor.submit(self.stream_excel, df, path, sheet_name))
+
+    def stream_excel(self, df, path, sheet_name):
+        '''
+        Writes a table to a write-only workbook, rows are appended one at a time and not kept in memory
+        :param df: pd table
+        :param path: str path of the workbook
+        :param sheet_name: str name of the worksheet
+        :return: None
+        '''
+        start = time.perf_counter()
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append([str(x) for x in df.columns])
+        values = df.astype(object).where(df.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            sheet.append(row)
+        workbook.save(path)
+        self.record(path, start)
+
+    def wait(self):
+        '''
+        Waits for the background writes to finish, raising any error they encountered
+        :return: None
+        '''
+        futures = self.futures
+        self.futures = []
+        for future in futures:
+            future.result()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def get_times(self):
+        return self.times
@@ -0,0 +1,231 @@
+import io
+import json
+import os
+import socketserver
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from arborator.parameters import get_parser, get_config, validate_inputs
+from arborator.constants import (PROFILE_KEY, PROFILE_LONG, METADATA_KEY, METADATA_LONG, OUTDIR_KEY, OUTDIR_LONG,
+                                 VALIDATE_ONLY_KEY)
+from arborator.utils import encode_profiles, cluster_reporter
+
+class profile_service:
+    """
+    Keeps the encoded allele profiles of one profile file loaded and runs
+    jobs against them, so that the profiles are parsed and encoded once
+    rather than by every run.
+
+    A job is a dict of parameters, as given on the command line or in a
+    config file, without the profile. The profiles are reloaded before a job
+    when the modification time or size of the profile file has changed.
+    Requests are handled one at a time, in the order they arrive.
+
+    Requests are dicts with a command: status, run (with the job as config)
+    or shutdown. Over HTTP, GET /status, POST /jobs (with the job as the
+    body) and POST /shutdown map to these commands, over a Unix socket each
+    line is a request in JSON and is answered by a line in JSON.
+    """
+    HOST = "127.0.0.1"
+    COMMANDS = ['status', 'run', 'shutdown']
+
+    def __init__(self, profile_file):
+        '''
+        :param profile_file: path to the profiles to keep loaded
+        '''
+        self.profile_file = profile_file
+        self.encoded_profiles = None
+        self.file_state = None
+        self.loaded_at = None
+        self.count_loads = 0
+        self.count_jobs = 0
+        self.running = True
+        self.refresh()
+
+    def get_file_state(self):
+        stat = os.stat(self.profile_file)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self):
+        '''
+        Loads the profiles if they were not loaded yet or if the profile file has changed since they were
+        :return: True if the profiles were loaded
+        '''
+        file_state = self.get_file_state()
+        if self.encoded_profiles is not None and file_state == self.file_state:
+            return False
+
+        print(f'Loading profiles from {self.profile_file}', flush=True)
+        self.encoded_profiles = encode_profiles(self.profile_file)
+        self.file_state = file_state
+        self.loaded_at = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+        self.count_loads += 1
+        return True
+
+    def get_status(self):
+        return {
+            'status': 'ok',
+            PROFILE_KEY: self.profile_file,
+            'num_samples': len(self.encoded_profiles['sample_ids']),
+            'num_loci': len(self.encoded_profiles['loci']),
+            'loaded_at': self.loaded_at,
+            'count_loads': self.count_loads,
+            'count_jobs': self.count_jobs,
+        }
+
+    def get_job_config(self, job):
+        '''
+        Creates the parameters of a job the same way as for the command line: defaults, then the job's parameters,
+        then the parameters of its config file
+        :param job: dict of parameters
+        :return: dict of parameters
+        '''
+        if not isinstance(job, dict):
+            message = f'A job needs to be a JSON object of parameters: {job}'
+            raise Exception(message)
+
+        if PROFILE_KEY in job and job[PROFILE_KEY] != self.profile_file:
+            message = f'This service only runs jobs against {self.profile_file}, the job profile is {job[PROFILE_KEY]}'
+            raise Exception(message)
+
+        args = [PROFILE_LONG, self.profile_file, METADATA_LONG, str(job.get(METADATA_KEY, '')), OUTDIR_LONG, str(job.get(OUTDIR_KEY, ''))]
+        config = vars(get_parser().parse_args(args))
+        for field in job:
+            config[field] = job[field]
+        return get_config(config)
+
+    def run_job(self, job):
+        '''
+        Runs a job against the loaded profiles
+        :param job: dict of parameters
+        :return: dict with the status of the job and its output
+        '''
+        start = time.perf_counter()
+        log = io.StringIO()
+        result = {'status': 'ok'}
+        try:
+            with redirect_stdout(log):
+                config = self.get_job_config(job)
+                result['profiles_reloaded'] = self.refresh()
+                if config[VALIDATE_ONLY_KEY]:
+                    validate_inputs(config)
+                else:
+                    cluster_reporter(config, encoded_profiles=self.encoded_profiles)
+                result[OUTDIR_KEY] = config[OUTDIR_KEY]
+        except Exception as e:
+            result = {'status': 'error', 'message': str(e)}
+
+        self.count_jobs += 1
+        result['wall_time_s'] = round(time.perf_counter() - start, 6)
+        result['log'] = log.getvalue()
+        print(f'Job {self.count_jobs}: {result["status"]} in {result["wall_time_s"]} s', flush=True)
+        return result
+
+    def handle(self, request):
+        '''
+        Handles a request
+        :param request: dict with a command and, to run a job, its config
+        :return: dict response
+        '''
+        command = request.get('command') if isinstance(request, dict) else None
+        if command not in self.COMMANDS:
+            return {'status': 'error', 'message': f'Command supplied is invalid: {command}, it needs to be one of {", ".join(self.COMMANDS)}'}
+        if command == 'status':
+            return self.get_status()
+        if command == 'shutdown':
+            self.running = False
+            return {'status': 'ok'}
+        return self.run_job(request.get('config', {}))
+
+    def serve_http(self, port):
+        '''
+        Handles requests over HTTP on localhost until a shutdown request
+        :param port: int port to listen on
+        :return: None
+        '''
+        server = HTTPServer((self.HOST, port), http_handler)
+        server.service = self
+        print(f'Listening on http://{self.HOST}:{server.server_port}', flush=True)
+        try:
+            while self.running:
+                server.handle_request()
+        finally:
+            server.server_close()
+
+    def serve_socket(self, path):
+        '''
+        Handles requests over a Unix socket until a shutdown request
+        :param path: path of the socket
+        :return: None
+        '''
+        if os.path.exists(path):
+            message = f'Socket path {path} already exists, please remove it or choose another path'
+            raise Exception(message)
+
+        server = socketserver.UnixStreamServer(path, socket_handler)
+        server.service = self
+        print(f'Listening on {path}', flush=True)
+        try:
+            while self.running:
+                server.handle_request()
+        finally:
+            server.server_close()
+            os.remove(path)
+
+class socket_handler(socketserver.StreamRequestHandler):
+    # Each line is a JSON request, answered by a JSON line
+    def handle(self):
+        service = self.server.service
+        for line in self.rfile:
+            if line.strip() == b'':
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {'status': 'error', 'message': f'Request is not valid JSON: {e}'}
+            else:
+                response = service.handle(request)
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+            if not service.running:
+                break
+
+class http_handler(BaseHTTPRequestHandler):
+    ROUTES = {
+        ('GET', '/status'): 'status',
+        ('POST', '/jobs'): 'run',
+        ('POST', '/shutdown'): 'shutdown',
+    }
+
+    def reply(self, code, response):
+        body = json.dumps(response).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self, method):
+        command = self.ROUTES.get((method, self.path))
+        if command is None:
+            self.reply(404, {'status': 'error', 'message': f'Unknown request {method} {self.path}'})
+            return
+
+        request = {'command': command}
+        if command == 'run':
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                request['config'] = json.loads(self.rfile.read(length))
+            except ValueError as e:
+                self.reply(400, {'status': 'error', 'message': f'Request is not valid JSON: {e}'})
+                return
+
+        response = self.server.service.handle(request)
+        self.reply(200 if response['status'] == 'ok' else 400, response)
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_POST(self):
+        self.route('POST')
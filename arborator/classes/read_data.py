@@ -1,19 +1,50 @@
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
 import os
+from arborator.constants import EXTENSIONS
+
+COLUMNAR_FORMATS = ['parquet', 'arrow']
 
 class read_data:
 
     def __init__(self,input_file):
+        '''
+        :param input_file: path to a text (tsv), parquet or arrow (feather) file, the format is detected by extension,
+                           or a pandas DataFrame or pyarrow Table, which is read like a columnar file
+        '''
         self.input_file = input_file
-        self.status = self.is_file_ok(self.input_file)
         self.messages = []
+        if not isinstance(input_file, str):
+            self.format = 'table'
+            self.df = self.convert_table(self.to_arrow(input_file))
+            self.status = len(self.df) > 0
+            return
+
+        self.format = self.get_format(self.input_file)
+        self.status = self.is_file_ok(self.input_file)
 
         if  self.status:
-            self.df = self.process_profile(input_file)
+            self.df = self.process_profile(input_file, format=self.format)
         else:
             self.df = pd.DataFrame()
             self.messages.append(f"Error unable to process {input_file}: is_file:{os.path.isfile(input_file)}")
 
+    @staticmethod
+    def get_format(f):
+        '''
+        Detects the format of a file from its extension, files without a columnar extension are read as text
+        :param f: string path to file
+        :return: str format [text, parquet, arrow]
+        '''
+        extension = os.path.splitext(f)[1].lstrip('.').lower()
+        for format in COLUMNAR_FORMATS:
+            if extension in EXTENSIONS[format]:
+                return format
+        return 'text'
+
     def is_file_ok(self,f):
         '''
         Helper function to determine if a profile file exists, has a header and >= 1 row of data
@@ -23,35 +54,127 @@ class read_data:
         status = True
         if not os.path.isfile(f):
             status = False
-        elif self.get_file_length(f) < 2:
+        elif self.format in COLUMNAR_FORMATS:
+            status = self.get_num_rows(f, self.format) >= 1
+        elif not self.has_rows(f):
             status = False
 
         return status
 
-    def get_file_length(self,f):
+    @staticmethod
+    def has_rows(f):
+        '''
+        Checks that a text file has a header with at least one column name followed by a row, reading at most two lines
+        :param f: string path to file
+        :return: True on success
+        '''
+        with open(f) as fh:
+            header = fh.readline()
+            row = fh.readline()
+        return header.strip() != '' and row != ''
+
+    @staticmethod
+    def get_num_rows(f, format):
+        '''
+        Reads the number of rows of a columnar file from its metadata, without loading the data
+        :param f: string path to file
+        :param format: format of the file [parquet, arrow]
+        :return: int, 0 if the file cannot be read
+        '''
+        try:
+            if format == 'parquet':
+                return pq.ParquetFile(f).metadata.num_rows
+            reader = pa.ipc.open_file(pa.memory_map(f, 'r'))
+            return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+        except (pa.ArrowException, OSError):
+            return 0
+
+    @staticmethod
+    def get_columns(f, format):
         '''
-        Counts the number of lines in a file
+        Reads the column names of a file without loading the data
         :param f: string path to file
-        :return: int
+        :param format: format of the file [text, parquet, arrow]
+        :return: list of column names
         '''
-        return int(os.popen(f'wc -l {f}').read().split()[0])
+        if format == 'parquet':
+            schema = pq.read_schema(f)
+        elif format == 'arrow':
+            schema = pa.ipc.open_file(pa.memory_map(f, 'r')).schema
+        else:
+            with open(f) as fh:
+                return fh.readline().rstrip('\r\n').split("\t")
+        return [c for c in schema.names if not c.startswith('__index_level_')]
+
+    @staticmethod
+    def read_table(f, format, keep_int=False):
+        '''
+        Reads a columnar file through pyarrow, values are converted to strings to match the text format
+        :param f: string path to file
+        :param format: format of the file [parquet, arrow]
+        :param keep_int: keep integer columns without missing values as integers
+        :return: pd
+        '''
+        if format == 'parquet':
+            table = pq.read_table(f)
+        else:
+            table = feather.read_table(f, memory_map=True)
+        return read_data.convert_table(table, keep_int=keep_int)
+
+    @staticmethod
+    def to_arrow(data):
+        '''
+        Converts an in-memory table to a pyarrow Table
+        :param data: pandas DataFrame or pyarrow Table, the index of a DataFrame is not kept
+        :return: pyarrow Table
+        '''
+        if isinstance(data, pa.Table):
+            return data
+        if not isinstance(data, pd.DataFrame):
+            message = f'Input needs to be a file path, a pandas DataFrame or a pyarrow Table, not {type(data).__name__}'
+            raise Exception(message)
+
+        # Columns of mixed python objects are converted to strings, missing values are kept:
+        data = data.copy()
+        data.columns = [str(c) for c in data.columns]
+        for c in data.columns:
+            if data[c].dtype == object:
+                data[c] = data[c].where(data[c].isna(), data[c].astype(str))
+        return pa.Table.from_pandas(data, preserve_index=False)
+
+    @staticmethod
+    def convert_table(table, keep_int=False):
+        '''
+        Converts a pyarrow Table to pandas, values are converted to strings to match the text format
+        :param table: pyarrow Table
+        :param keep_int: keep integer columns without missing values as integers
+        :return: pd
+        '''
+        fields = []
+        for field, column in zip(table.schema, table.columns):
+            if keep_int and pa.types.is_integer(field.type) and column.null_count == 0:
+                fields.append(field)
+            else:
+                fields.append(pa.field(field.name, pa.string()))
+        table = table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+        df = table.to_pandas()
+        # An index stored by pandas is restored by pyarrow, return it as a column like the text format:
+        if not isinstance(df.index, pd.RangeIndex):
+            df = df.reset_index()
+        return df.fillna(np.nan)
 
     def process_profile(self,file_path, format="text"):
         '''
-        Reads in a file in (text, parquet) formats and produces a df
+        Reads in a file in (text, parquet, arrow) formats and produces a df
         :param profile_path: path to file
-        :param format: format of the file [text, parquet]
+        :param format: format of the file [text, parquet, arrow]
         :return:  pd
         '''
 
         if format == 'text':
             df = pd.read_csv(file_path, header=0, sep="\t", low_memory=False, dtype=str)
-        elif format == 'parquet':
-            df = pd.read_parquet(
-                file_path,
-                engine='auto',
-                columns=None,
-                storage_options=None,
-            )
-
-        return df
\ No newline at end of file
+        elif format in COLUMNAR_FORMATS:
+            df = self.read_table(file_path, format)
+
+        return df
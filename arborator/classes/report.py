@@ -1,12 +1,16 @@
 import sys
-
+import numpy as np
 from scipy.stats import entropy
 
 class report:
 
     def __init__(self,df,columns_to_skip=[],scale=True,missing_data='0'):
-        self.loci = self.get_col_counts(df,columns_to_skip,scale=True,missing_data='0')
-        pass
+        columns = [c for c in df.columns if c not in columns_to_skip]
+        if len(columns) > 0 and all(df[c].dtype.kind in 'iu' for c in columns):
+            # integer encoded allele profiles, all loci are counted at once
+            self.loci = self.get_allele_counts(df[columns].to_numpy(), columns, scale=True, missing_allele=int(missing_data))
+        else:
+            self.loci = self.get_col_counts(df,columns_to_skip,scale=True,missing_data='0')
 
     def get_col_counts(self,df,columns_to_skip=[],scale=True,missing_data='0'):
         loci = {}
@@ -37,6 +41,72 @@ class report:
             loci[col] = locus
         return loci
 
+    def get_allele_counts(self,profiles,loci,scale=True,missing_allele=0):
+        '''
+        Counts the alleles of every locus of an integer allele matrix at once, equivalent to get_col_counts
+        :param profiles: 2D numpy integer array of allele codes, one column per locus
+        :param loci: list of locus names, one per column
+        :param scale: normalize the shannon entropy by the maximum entropy of the number of alleles
+        :param missing_allele: int code of missing alleles
+        :return: dict of locus: {num_values, num_missing, value_counts, shannon_entropy}
+        '''
+        num_rows, num_loci = profiles.shape
+        if num_rows == 0:
+            return {locus: {'num_values': 0, 'num_missing': 0, 'value_counts': {}, 'shannon_entropy': -1} for locus in loci}
+
+        # Runs of equal alleles in each sorted column, with the row of their first occurrence:
+        order = np.argsort(profiles, axis=0, kind='stable')
+        values = np.take_along_axis(profiles, order, axis=0).T.ravel()
+        rows = order.T.ravel()
+        starts = np.ones(values.shape, dtype=bool)
+        starts[1:] = values[1:] != values[:-1]
+        starts[::num_rows] = True
+        starts = np.flatnonzero(starts)
+        run_locus = starts // num_rows
+        run_value = values[starts]
+        run_first = rows[starts]
+        run_count = np.diff(np.append(starts, values.size))
+
+        missing = run_value == missing_allele
+        num_missing = np.zeros(num_loci, dtype=np.int64)
+        num_missing[run_locus[missing]] = run_count[missing]
+        run_locus = run_locus[~missing]
+        run_value = run_value[~missing]
+        run_first = run_first[~missing]
+        run_count = run_count[~missing]
+
+        num_values = np.bincount(run_locus, minlength=num_loci)
+        totals = np.bincount(run_locus, weights=run_count, minlength=num_loci)
+        frequencies = run_count / totals[run_locus]
+        shannon_entropy = -np.bincount(run_locus, weights=frequencies * np.log(frequencies), minlength=num_loci)
+        if scale:
+            multiple = num_values > 1
+            shannon_entropy[multiple] = shannon_entropy[multiple] / np.log(num_values[multiple])
+
+        # Most frequent allele first and ties in order of first occurrence, like value_counts:
+        ordering = np.lexsort((run_first, -run_count, run_locus))
+        alleles = [str(x) for x in run_value[ordering].tolist()]
+        counts = run_count[ordering].tolist()
+        bounds = np.concatenate([[0], np.cumsum(num_values)]).tolist()
+
+        result = {}
+        num_values = num_values.tolist()
+        num_missing = num_missing.tolist()
+        shannon_entropy = shannon_entropy.tolist()
+        for i, locus in enumerate(loci):
+            locus_entropy = -1
+            if num_values[i] > 1:
+                locus_entropy = shannon_entropy[i]
+            elif num_values[i] == 1:
+                locus_entropy = 0
+            result[locus] = {
+                'num_values': num_values[i],
+                'num_missing': num_missing[i],
+                'value_counts': dict(zip(alleles[bounds[i]:bounds[i + 1]], counts[bounds[i]:bounds[i + 1]])),
+                'shannon_entropy': locus_entropy,
+            }
+        return result
+
     def calc_shanon_entropy(self,value_list,scale=True):
 
         total = sum(value_list)
@@ -51,17 +121,18 @@ class report:
 
 
     def write_data(self,outfile):
+        lines = ["locus\tnum_values\tnum_missing\tshannon_entropy\tvalue_counts\n"]
+        for l in self.loci:
+            row = [
+                l,
+                self.loci[l]['num_values'],
+                self.loci[l]['num_missing'],
+                self.loci[l]['shannon_entropy'],
+                self.loci[l]['value_counts']
+            ]
+            lines.append("{}\n".format("\t".join([str(x) for x in row])))
         with open(outfile,'w') as oh:
-            oh.write("locus\tnum_values\tnum_missing\tshannon_entropy\tvalue_counts\n")
-            for l in self.loci:
-                row = [
-                    l,
-                    self.loci[l]['num_values'],
-                    self.loci[l]['num_missing'],
-                    self.loci[l]['shannon_entropy'],
-                    self.loci[l]['value_counts']
-                ]
-                oh.write("{}\n".format("\t".join([str(x) for x in row])))
+            oh.write("".join(lines))
 
 
     def get_data(self):
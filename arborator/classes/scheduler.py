@@ -0,0 +1,94 @@
+import psutil
+
+class scheduler:
+    """
+    Orders groups into worker tasks based on their estimated cost.
+
+    The cost of a group is dominated by the pairwise distance calculation
+    (members^2 * loci) and its memory by the condensed distance matrix and
+    the copies used for clustering (members^2). Tasks are ordered
+    largest first so that the biggest groups do not start last, and groups
+    too small to be worth a task of their own are batched together.
+    """
+    # Compact integer condensed matrix + float64 condensed matrix for clustering and its linkage working copy,
+    # per cell of the square matrix
+    MATRIX_BYTES_PER_CELL = 10
+    # Out-of-core groups only keep the linkage working copy of the float64 condensed matrix in memory
+    LINKAGE_BYTES_PER_CELL = 4
+    PROFILE_BYTES_PER_CELL = 8
+    TINY_GROUP_MEMBERS = 16
+    TINY_GROUP_BATCH_SIZE = 64
+
+    def __init__(self, group_sizes, num_loci, min_members=2, max_memory=None, tile_size=None):
+        '''
+        :param group_sizes: dict of group id: number of members
+        :param num_loci: int number of loci in the profiles
+        :param min_members: int minimum number of members for a group to be clustered
+        :param max_memory: memory budget in bytes for concurrently running tasks, defaults to the available memory
+        :param tile_size: working memory in bytes of a tile when groups are processed out-of-core, None when in memory
+        '''
+        self.num_loci = num_loci
+        self.min_members = min_members
+        self.max_memory = max_memory
+        self.tile_size = tile_size
+        if self.max_memory is None:
+            self.max_memory = psutil.virtual_memory().available
+
+        self.estimates = {}
+        for group_id in group_sizes:
+            self.estimates[group_id] = self.estimate_group(group_sizes[group_id])
+
+        self.tasks = self.create_tasks()
+
+    def estimate_group(self, num_members):
+        '''
+        Estimates the work and peak memory needed to process a group
+        :param num_members: int number of members in the group
+        :return: dict
+        '''
+        memory = num_members * self.num_loci * self.PROFILE_BYTES_PER_CELL
+        cost = num_members * self.num_loci
+        num_pairs = 0
+        if num_members >= self.min_members:
+            num_pairs = num_members * (num_members - 1) // 2
+            if self.tile_size is None:
+                memory += num_members * num_members * self.MATRIX_BYTES_PER_CELL
+            else:
+                memory += self.tile_size + num_members * num_members * self.LINKAGE_BYTES_PER_CELL
+            cost += num_pairs * self.num_loci
+
+        return {
+            'count_members': num_members,
+            'count_pairs': num_pairs,
+            'cost': cost,
+            'memory': memory,
+        }
+
+    def create_tasks(self):
+        '''
+        Creates the list of tasks, largest estimated cost first
+        :return: list of dicts with group_ids, cost and memory
+        '''
+        tasks = []
+        batch = None
+        for group_id in sorted(self.estimates, key=lambda x: self.estimates[x]['cost'], reverse=True):
+            estimate = self.estimates[group_id]
+            if estimate['count_members'] > self.TINY_GROUP_MEMBERS:
+                tasks.append({'group_ids': [group_id], 'cost': estimate['cost'], 'memory': estimate['memory']})
+                continue
+
+            if batch is None or len(batch['group_ids']) == self.TINY_GROUP_BATCH_SIZE:
+                batch = {'group_ids': [], 'cost': 0, 'memory': 0}
+                tasks.append(batch)
+            batch['group_ids'].append(group_id)
+            batch['cost'] += estimate['cost']
+            # Groups in a batch are processed one after another:
+            batch['memory'] = max(batch['memory'], estimate['memory'])
+
+        return tasks
+
+    def get_tasks(self):
+        return self.tasks
+
+    def get_estimates(self):
+        return self.estimates
@@ -0,0 +1,163 @@
+import json
+import os
+import platform
+
+class shards:
+    """
+    Splits the groups of an analysis into shards which are processed
+    independently, for example as the tasks of a job array, and collects
+    their results for merging.
+
+    The shard manifest lists the parameters of the run and, for every group
+    to cluster, its directory, number of members, estimated cost and shard.
+    Groups are assigned largest first to the shard with the lowest total
+    cost. Each shard writes the results of its groups to its own file in the
+    shard directory of the output directory, and the group directories to
+    the output directory itself, as a single run would.
+    """
+    SHARD_DIR = "shards"
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(self, outdir):
+        '''
+        :param outdir: output directory of the run
+        '''
+        self.outdir = outdir
+        self.directory = os.path.join(outdir, self.SHARD_DIR)
+        self.manifest = None
+
+    def get_manifest_path(self):
+        return os.path.join(self.directory, self.MANIFEST_FILE)
+
+    def get_results_path(self, index):
+        return os.path.join(self.directory, f"shard_{index}.json")
+
+    def plan(self, parameters, estimates, group_file_mapping, num_shards):
+        '''
+        Assigns the groups to shards, balancing their estimated cost
+        :param parameters: dict of run parameters, with absolute paths
+        :param estimates: dict of group id: estimate of the scheduler, for the groups to cluster
+        :param group_file_mapping: dict of group id: directory name
+        :param num_shards: int number of shards
+        :return: dict manifest
+        '''
+        for group_id in estimates:
+            if group_file_mapping[group_id] == self.SHARD_DIR:
+                message = f'The directory of group {group_id} ({self.SHARD_DIR}) is reserved for the shard manifest, it cannot be split into shards'
+                raise Exception(message)
+
+        shard_list = []
+        for i in range(num_shards):
+            shard_list.append({'index': i, 'group_ids': [], 'count_members': 0, 'count_pairs': 0, 'memory': 0, 'cost': 0})
+
+        groups = {}
+        for group_id in sorted(estimates, key=lambda x: estimates[x]['cost'], reverse=True):
+            estimate = estimates[group_id]
+            shard = min(shard_list, key=lambda x: x['cost'])
+            shard['group_ids'].append(group_id)
+            shard['count_members'] += estimate['count_members']
+            shard['count_pairs'] += estimate['count_pairs']
+            shard['memory'] = max(shard['memory'], estimate['memory'])
+            shard['cost'] += estimate['cost']
+            groups[group_id] = {
+                'directory': group_file_mapping[group_id],
+                'count_members': estimate['count_members'],
+                'count_pairs': estimate['count_pairs'],
+                'memory': estimate['memory'],
+                'cost': estimate['cost'],
+                'shard': shard['index'],
+            }
+
+        self.manifest = {
+            'parameters': parameters,
+            'num_shards': num_shards,
+            'shards': shard_list,
+            'groups': groups,
+        }
+        return self.manifest
+
+    def write_manifest(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0o755)
+        with open(self.get_manifest_path(), 'w') as fh:
+            fh.write(json.dumps(self.manifest, indent=4))
+
+    def read_manifest(self):
+        path = self.get_manifest_path()
+        if not os.path.isfile(path):
+            message = f'Shard manifest {path} does not exist, please run arborator plan first'
+            raise Exception(message)
+        with open(path) as fh:
+            self.manifest = json.loads(fh.read())
+        return self.manifest
+
+    def get_parameters(self):
+        return dict(self.manifest['parameters'])
+
+    def get_group_ids(self, index):
+        '''
+        :param index: int index of the shard
+        :return: list of the group ids of the shard
+        '''
+        if not isinstance(index, int) or index < 0 or index >= self.manifest['num_shards']:
+            message = f'Shard {index} does not exist, it needs to be between 0 and {self.manifest["num_shards"] - 1}'
+            raise Exception(message)
+        return self.manifest['shards'][index]['group_ids']
+
+    def check_groups(self, group_rows, clustered, group_file_mapping):
+        '''
+        Checks that the inputs still produce the groups of the manifest
+        :param group_rows: dict of group id: array of the profile rows of the group
+        :param clustered: list of group ids to cluster
+        :param group_file_mapping: dict of group id: directory name
+        :return: None
+        '''
+        groups = self.manifest['groups']
+        changed = len(clustered) != len(groups)
+        for group_id in clustered:
+            if changed:
+                break
+            changed = (group_id not in groups or groups[group_id]['directory'] != group_file_mapping[group_id]
+                       or groups[group_id]['count_members'] != len(group_rows[group_id]))
+        if changed:
+            message = f'The groups of the inputs differ from the shard manifest {self.get_manifest_path()}, the inputs changed since it was planned'
+            raise Exception(message)
+
+    def write_results(self, index, group_records, run_data):
+        '''
+        Writes the results of the groups of a shard
+        :param index: int index of the shard
+        :param group_records: dict of group id: {results, fingerprint, carried_over}
+        :param run_data: dict of the shard's run information
+        :return: None
+        '''
+        data = dict(run_data)
+        data['index'] = index
+        data['hostname'] = platform.node()
+        data['groups'] = group_records
+        with open(self.get_results_path(index), 'w') as fh:
+            fh.write(json.dumps(data, indent=4))
+
+    def read_results(self):
+        '''
+        Reads the results of every shard
+        :return: (dict of group id: {results, fingerprint, carried_over}, list of the shards' run information)
+        '''
+        group_records = {}
+        shard_data = []
+        for shard in self.manifest['shards']:
+            path = self.get_results_path(shard['index'])
+            if not os.path.isfile(path):
+                message = f'Shard {shard["index"]} has not finished, {path} does not exist'
+                raise Exception(message)
+            with open(path) as fh:
+                data = json.loads(fh.read())
+            group_records.update(data.pop('groups'))
+            shard_data.append(data)
+
+        for group_id in self.manifest['groups']:
+            if group_id not in group_records:
+                message = f'The results of group {group_id} are missing from shard {self.manifest["groups"][group_id]["shard"]}'
+                raise Exception(message)
+
+        return (group_records, shard_data)
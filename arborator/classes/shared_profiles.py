@@ -0,0 +1,40 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+class shared_profiles:
+    """
+    Integer encoded allele profiles held in a shared memory block.
+
+    The main process creates the block once from the encoded profile matrix
+    and worker processes attach to it by name, so each worker can take the
+    rows for its group without the profiles being written to disk, parsed
+    again or pickled.
+    """
+
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+        if name is None:
+            size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        self.name = self.shm.name
+        self.profiles = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def get_rows(self, rows):
+        '''
+        Copies the requested rows out of the shared block
+        :param rows: list or numpy array of row indices
+        :return: 2D numpy array
+        '''
+        return self.profiles[rows]
+
+    def close(self):
+        self.profiles = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
@@ -1,5 +1,7 @@
 from arborator.classes.read_data import read_data
 import re
+import numpy as np
+import pandas as pd
 
 class split_profiles:
 
@@ -16,8 +18,11 @@ class split_profiles:
         return
 
     def parse_partition_file(self):
-        partition = read_data(self.partition_file)
-        data_frame = partition.df
+        # The partitions are either read from a file or taken from a metadata table already in memory:
+        if isinstance(self.partition_file, pd.DataFrame):
+            data_frame = self.partition_file
+        else:
+            data_frame = read_data(self.partition_file).df
 
         if self.partition_col not in data_frame:
             message = f'the partition column {self.partition_col} does not exist in the data'
@@ -31,7 +36,7 @@ class split_profiles:
         SPECIAL_REGEX = "[^A-Za-z0-9_\-.]" # For file names.
         REPLACEMENT_CHARACTER = "_"
         self.groups = {}
-        self.used_filepaths = []
+        self.used_filepaths = set()
         self.group_file_mapping = {}
             # A file path-safe version of the ID for file writing.
             # Example: {"1": "1", "United Kingdom": "United_Kingdom"}
@@ -50,15 +55,23 @@ class split_profiles:
                 while filepath in self.used_filepaths:
                     filepath += "-1"
 
-                self.used_filepaths.append(filepath)
+                self.used_filepaths.add(filepath)
                 self.group_file_mapping[group_id] = filepath
 
             self.groups[group_id].append(sample_id)
 
     def subset_df(self,df,id_col):
+        # Rows are assigned to their group in a single pass, each subset keeps the original index and row order:
+        group_ids = df[id_col].map(self.partitions).to_numpy()
+        assigned = pd.notna(group_ids)
+        positions = np.flatnonzero(assigned)
+        group_ids = pd.Series(group_ids[assigned]).astype(str)
+        rows = group_ids.groupby(group_ids, sort=False).indices
+
         subsets = {}
         for group_id in self.groups:
-            subsets[group_id] = df[df[id_col].isin(self.groups[group_id])]
+            if group_id in rows:
+                subsets[group_id] = df.iloc[positions[rows[group_id]]]
+            else:
+                subsets[group_id] = df.iloc[[]]
         return subsets
-
-
@@ -0,0 +1,107 @@
+import threading
+import time
+from contextlib import contextmanager
+import psutil
+
+class stage_timer:
+    """
+    Records the wall time, CPU time and peak resident memory (RSS) of the
+    stages of a run or of a group.
+
+    While a stage runs, a background thread samples the RSS of the process
+    every SAMPLE_INTERVAL seconds, so the peak includes memory that is freed
+    again before the stage ends. The thread only exists while a stage runs,
+    which keeps it out of any worker processes forked in between. Stages do
+    not nest; a stage entered more than once accumulates its times.
+    """
+    SAMPLE_INTERVAL = 0.02
+    BYTES_PER_MB = 1024 ** 2
+
+    def __init__(self):
+        self.process = psutil.Process()
+        self.pid = self.process.pid
+        self.stages = {}
+        self.peak_rss = 0
+        self.current = None
+        self.thread = None
+        self.stop = threading.Event()
+
+    def sample(self):
+        self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+
+    def run_sampler(self):
+        while not self.stop.wait(self.SAMPLE_INTERVAL):
+            self.sample()
+
+    def start(self, name, sample=True):
+        '''
+        Starts timing a stage
+        :param name: str name of the stage
+        :param sample: sample the RSS during the stage, otherwise only at its start and end
+        '''
+        self.current = name
+        self.peak_rss = 0
+        self.sample()
+        self.thread = None
+        if sample:
+            self.stop.clear()
+            self.thread = threading.Thread(target=self.run_sampler, daemon=True)
+            self.thread.start()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+
+    def end(self):
+        '''
+        Stops timing the current stage and records it
+        '''
+        wall_time = time.perf_counter() - self.wall_start
+        cpu_time = time.process_time() - self.cpu_start
+        if self.thread is not None:
+            self.stop.set()
+            self.thread.join()
+            self.thread = None
+        self.sample()
+        self.add(self.current, wall_time, cpu_time, self.peak_rss)
+        self.current = None
+
+    @contextmanager
+    def stage(self, name, sample=True):
+        '''
+        Times the code within the context as a stage
+        :param name: str name of the stage
+        :param sample: sample the RSS during the stage, otherwise only at its start and end
+        '''
+        self.start(name, sample=sample)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def add(self, name, wall_time, cpu_time, peak_rss):
+        if name not in self.stages:
+            self.stages[name] = {'wall_time_s': 0.0, 'cpu_time_s': 0.0, 'peak_rss_mb': 0.0}
+        record = self.stages[name]
+        record['wall_time_s'] = round(record['wall_time_s'] + wall_time, 6)
+        record['cpu_time_s'] = round(record['cpu_time_s'] + cpu_time, 6)
+        record['peak_rss_mb'] = round(max(record['peak_rss_mb'], peak_rss / self.BYTES_PER_MB), 3)
+
+    def get_stages(self):
+        return self.stages
+
+    @staticmethod
+    def combine(stage_records):
+        '''
+        Totals the stages of several timers, wall and CPU times are summed and the peak RSS is the largest
+        :param stage_records: list of dicts of stages, as returned by get_stages
+        :return: dict of stages
+        '''
+        totals = {}
+        for stages in stage_records:
+            for name in stages:
+                if name not in totals:
+                    totals[name] = {'wall_time_s': 0.0, 'cpu_time_s': 0.0, 'peak_rss_mb': 0.0}
+                record = totals[name]
+                record['wall_time_s'] = round(record['wall_time_s'] + stages[name]['wall_time_s'], 6)
+                record['cpu_time_s'] = round(record['cpu_time_s'] + stages[name]['cpu_time_s'], 6)
+                record['peak_rss_mb'] = max(record['peak_rss_mb'], stages[name]['peak_rss_mb'])
+        return totals
@@ -4,7 +4,14 @@ MIN_FILE_SIZE = 32
 
 EXTENSIONS = {'text': ['txt','tsv','mat','text'],
     'hd5': ['hd','h5','hdf5'],
-    'parquet': ['parq','parquet','pq']}
+    'parquet': ['parq','parquet','pq'],
+    'arrow': ['arrow','feather','ipc']}
+
+# How the Excel reports are written, see output_writer
+EXCEL_MODES = ['memory', 'streaming', 'background', 'skip']
+
+# Same as multi_level_clustering.VALID_TREE_DISTANCES, which cannot be imported without loading the scientific stack
+TREE_DISTANCES = ['patristic', 'cophenetic']
 
 
 FILE_FORMATS = ['tsv','parquet','json']
@@ -38,4 +45,172 @@ RUN_DATA = {
     },
     'loci_removed': [],
     'result_file':''
-}
\ No newline at end of file
+}
+
+# PARAMETERS
+PROFILE_KEY = "profile"
+PROFILE_LONG = "--" + PROFILE_KEY
+PROFILE_SHORT = "-p"
+
+METADATA_KEY = "metadata"
+METADATA_LONG = "--" + METADATA_KEY
+METADATA_SHORT = "-r"
+
+CONFIG_KEY = "config"
+CONFIG_LONG = "--" + CONFIG_KEY
+CONFIG_SHORT = "-c"
+
+OUTDIR_KEY = "outdir"
+OUTDIR_LONG = "--" + OUTDIR_KEY
+OUTDIR_SHORT = "-o"
+
+PARTITION_COLUMN_KEY = "partition_col"
+PARTITION_COLUMN_LONG = "--" + PARTITION_COLUMN_KEY
+PARTITION_COLUMN_SHORT = "-a"
+
+ID_COLUMN_KEY = "id_col"
+ID_COLUMN_LONG = "--" + ID_COLUMN_KEY
+ID_COLUMN_SHORT = "-i"
+
+OUTLIER_THRESHOLD_KEY = "outlier_thresh"
+OUTLIER_THRESHOLD_LONG = "--" + OUTLIER_THRESHOLD_KEY
+
+MINIMUM_MEMBERS_KEY = "min_members"
+MINIMUM_MEMBERS_LONG= "--" + MINIMUM_MEMBERS_KEY
+MINIMUM_MEMBERS_SHORT = "-m"
+
+COUNT_MISSING_KEY = "count_missing"
+COUNT_MISSING_LONG = "--" + COUNT_MISSING_KEY
+COUNT_MISSING_SHORT = "-n"
+
+MISSING_THRESHOLD_KEY = "missing_thresh"
+MISSING_THRESHOLD_LONG = "--" + MISSING_THRESHOLD_KEY
+
+DISTANCE_METHOD_KEY = "distm"
+DISTANCE_METHOD_LONG = "--" + DISTANCE_METHOD_KEY
+
+SKIP_QC_KEY = "skip_qc"
+SKIP_QC_LONG = "--" + SKIP_QC_KEY
+SKIP_QC_SHORT = "-s"
+
+THRESHOLDS_KEY = "thresholds"
+THRESHOLDS_LONG = "--" + THRESHOLDS_KEY
+THRESHOLDS_SHORT = "-t"
+
+DELIMITER_KEY = "delimiter"
+DELIMITER_LONG = "--" + DELIMITER_KEY
+DELIMITER_SHORT = "-d"
+
+CLUSTER_METHOD_KEY = "method"
+CLUSTER_METHOD_LONG = "--" + CLUSTER_METHOD_KEY
+CLUSTER_METHOD_SHORT = "-e"
+
+SWEEP_THRESHOLDS_KEY = "sweep_thresholds"
+SWEEP_THRESHOLDS_LONG = "--" + SWEEP_THRESHOLDS_KEY
+
+SWEEP_METHODS_KEY = "sweep_methods"
+SWEEP_METHODS_LONG = "--" + SWEEP_METHODS_KEY
+
+TREE_DISTANCES_KEY = "tree_distances"
+TREE_DISTANCES_LONG = "--" + TREE_DISTANCES_KEY
+
+FORCE_KEY = "force"
+FORCE_LONG = "--" + FORCE_KEY
+FORCE_SHORT = "-f"
+
+SORT_MATRIX_KEY = "sort_matrix"
+SORT_MATRIX_LONG = "--" + SORT_MATRIX_KEY
+
+SKIP_MATRIX_KEY = "skip_matrix"
+SKIP_MATRIX_LONG = "--" + SKIP_MATRIX_KEY
+
+CONDENSED_MATRIX_KEY = "condensed_matrix"
+CONDENSED_MATRIX_LONG = "--" + CONDENSED_MATRIX_KEY
+
+TILE_SIZE_KEY = "tile_size"
+TILE_SIZE_LONG = "--" + TILE_SIZE_KEY
+
+PROFILE_RUN_KEY = "profile_run"
+PROFILE_RUN_LONG = "--" + PROFILE_RUN_KEY
+
+EXCEL_KEY = "excel"
+EXCEL_LONG = "--" + EXCEL_KEY
+
+PLAN_KEY = "plan"
+PLAN_LONG = "--" + PLAN_KEY
+
+VALIDATE_ONLY_KEY = "validate_only"
+VALIDATE_ONLY_LONG = "--" + VALIDATE_ONLY_KEY
+
+THREADS_KEY = "n_threads"
+THREADS_LONG = "--" + THREADS_KEY
+
+MAX_MEMORY_KEY = "max_memory"
+MAX_MEMORY_LONG = "--" + MAX_MEMORY_KEY
+
+INCREMENTAL_KEY = "incremental"
+INCREMENTAL_LONG = "--" + INCREMENTAL_KEY
+
+DISTANCE_CACHE_KEY = "distance_cache"
+DISTANCE_CACHE_LONG = "--" + DISTANCE_CACHE_KEY
+
+DISTANCE_CACHE_SIZE_KEY = "distance_cache_size"
+DISTANCE_CACHE_SIZE_LONG = "--" + DISTANCE_CACHE_SIZE_KEY
+
+NUM_SHARDS_KEY = "num_shards"
+NUM_SHARDS_LONG = "--" + NUM_SHARDS_KEY
+
+SHARD_KEY = "shard"
+SHARD_LONG = "--" + SHARD_KEY
+
+SOCKET_KEY = "socket"
+SOCKET_LONG = "--" + SOCKET_KEY
+
+PORT_KEY = "port"
+PORT_LONG = "--" + PORT_KEY
+
+VERSION_KEY = "version"
+VERSION_LONG = "--" + VERSION_KEY
+VERSION_SHORT = "-V"
+
+ONLY_REPORT_LABELED_KEY = "only_report_labeled_columns"
+ONLY_REPORT_LABELED_LONG = "--" + ONLY_REPORT_LABELED_KEY
+
+GROUPED_METADATA_COLUMNS_KEY = "grouped_metadata_columns"
+LINELIST_COLUMNS_KEY = "linelist_columns"
+DISPLAY_KEY = "display"
+LABEL_KEY = "label"
+GAS_CLUSTER_ADDRESS_KEY = "gas_denovo_cluster_address"
+
+METADATA_INCLUDED_FILEPATH_TSV = "metadata.included.tsv"
+METADATA_INCLUDED_FILEPATH_EXCEL = "metadata.included.xlsx"
+METADATA_INCLUDED_SHEET_NAME = "Included Metadata"
+
+CLUSTER_SUMMARY_FILEPATH_TSV = "cluster_summary.tsv"
+CLUSTER_SUMMARY_FILEPATH_EXCEL = "cluster_summary.xlsx"
+CLUSTER_SUMMARY_SHEET_NAME = "Cluster Summary"
+
+PROFILE_STATS_FILE = "profile.pstats"
+
+SWEEP_KEY = "sweep"
+SWEEP_DIRECTORY = "sweep"
+SWEEP_COUNTS_FILEPATH_TSV = "cluster_counts.tsv"
+
+PARAMETER_KEYS = [PROFILE_KEY, METADATA_KEY, CONFIG_KEY, OUTDIR_KEY,
+                  PARTITION_COLUMN_KEY, ID_COLUMN_KEY, OUTLIER_THRESHOLD_KEY,
+                  MINIMUM_MEMBERS_KEY, COUNT_MISSING_KEY, MISSING_THRESHOLD_KEY,
+                  DISTANCE_METHOD_KEY, SKIP_QC_KEY, THRESHOLDS_KEY,
+                  DELIMITER_KEY, CLUSTER_METHOD_KEY, SWEEP_THRESHOLDS_KEY, SWEEP_METHODS_KEY, TREE_DISTANCES_KEY,
+                  FORCE_KEY, SORT_MATRIX_KEY, SKIP_MATRIX_KEY, CONDENSED_MATRIX_KEY, TILE_SIZE_KEY, PROFILE_RUN_KEY, EXCEL_KEY, PLAN_KEY, VALIDATE_ONLY_KEY, THREADS_KEY, MAX_MEMORY_KEY, INCREMENTAL_KEY,
+                  NUM_SHARDS_KEY,
+                  DISTANCE_CACHE_KEY, DISTANCE_CACHE_SIZE_KEY, VERSION_KEY,
+                  ONLY_REPORT_LABELED_KEY, GROUPED_METADATA_COLUMNS_KEY,
+                  LINELIST_COLUMNS_KEY]
+
+BOOLEAN_KEYS = [COUNT_MISSING_KEY, SKIP_QC_KEY, FORCE_KEY, SORT_MATRIX_KEY, SKIP_MATRIX_KEY, CONDENSED_MATRIX_KEY, PROFILE_RUN_KEY, PLAN_KEY, VALIDATE_ONLY_KEY, ONLY_REPORT_LABELED_KEY]
+
+# Expected to check lowercase:
+TRUE_STRINGS = ["t", "true"]
+
+# Expected to check lowercase:
+FALSE_STRINGS = ["f", "false"]
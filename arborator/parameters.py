@@ -0,0 +1,543 @@
+from argparse import (ArgumentParser, ArgumentDefaultsHelpFormatter, RawDescriptionHelpFormatter)
+import json
+import os
+from arborator.version import __version__
+from arborator.constants import (EXTENSIONS, EXCEL_MODES, TREE_DISTANCES, PROFILE_KEY, PROFILE_LONG, PROFILE_SHORT,
+                                 METADATA_KEY, METADATA_LONG, METADATA_SHORT, CONFIG_KEY, CONFIG_LONG, CONFIG_SHORT,
+                                 OUTDIR_KEY, OUTDIR_LONG, OUTDIR_SHORT, PARTITION_COLUMN_KEY, PARTITION_COLUMN_LONG,
+                                 PARTITION_COLUMN_SHORT, ID_COLUMN_KEY, ID_COLUMN_LONG, ID_COLUMN_SHORT,
+                                 OUTLIER_THRESHOLD_KEY, OUTLIER_THRESHOLD_LONG, MINIMUM_MEMBERS_KEY, MINIMUM_MEMBERS_LONG,
+                                 MINIMUM_MEMBERS_SHORT, COUNT_MISSING_KEY, COUNT_MISSING_LONG, COUNT_MISSING_SHORT,
+                                 MISSING_THRESHOLD_KEY, MISSING_THRESHOLD_LONG, DISTANCE_METHOD_KEY,
+                                 DISTANCE_METHOD_LONG, SKIP_QC_KEY, SKIP_QC_LONG, SKIP_QC_SHORT, THRESHOLDS_KEY,
+                                 THRESHOLDS_LONG, THRESHOLDS_SHORT, DELIMITER_KEY, DELIMITER_LONG, DELIMITER_SHORT,
+                                 CLUSTER_METHOD_KEY, CLUSTER_METHOD_LONG, CLUSTER_METHOD_SHORT, SWEEP_THRESHOLDS_KEY,
+                                 SWEEP_THRESHOLDS_LONG, SWEEP_METHODS_KEY, SWEEP_METHODS_LONG, TREE_DISTANCES_LONG,
+                                 FORCE_KEY, FORCE_LONG, FORCE_SHORT, SORT_MATRIX_LONG, SKIP_MATRIX_LONG,
+                                 CONDENSED_MATRIX_LONG, TILE_SIZE_KEY, TILE_SIZE_LONG, PROFILE_RUN_KEY,
+                                 PROFILE_RUN_LONG, EXCEL_KEY, EXCEL_LONG, PLAN_KEY, PLAN_LONG, VALIDATE_ONLY_LONG,
+                                 THREADS_KEY, THREADS_LONG, MAX_MEMORY_KEY, MAX_MEMORY_LONG, INCREMENTAL_KEY,
+                                 INCREMENTAL_LONG, DISTANCE_CACHE_LONG, DISTANCE_CACHE_SIZE_KEY,
+                                 DISTANCE_CACHE_SIZE_LONG, NUM_SHARDS_KEY, VERSION_LONG, VERSION_SHORT,
+                                 ONLY_REPORT_LABELED_LONG, GROUPED_METADATA_COLUMNS_KEY, LINELIST_COLUMNS_KEY,
+                                 DISPLAY_KEY, GAS_CLUSTER_ADDRESS_KEY, SWEEP_KEY, PARAMETER_KEYS, BOOLEAN_KEYS,
+                                 TRUE_STRINGS, FALSE_STRINGS)
+from genomic_address_service.constants import CLUSTER_METHODS
+from multiprocessing import cpu_count
+
+def get_parser():
+    """ Argument Parsing method.
+
+        A function to parse the command line arguments passed at initialization of Clade-o-matic,
+        format these arguments,  and return help prompts to the user shell when specified.
+
+        Returns
+        -------
+        ArgumentParser object
+            The arguments and their user specifications, the usage help prompts and the correct formatting
+            for the incoming argument (str, int, etc.)
+        """
+    class CustomFormatter(ArgumentDefaultsHelpFormatter, RawDescriptionHelpFormatter):
+        """
+                Class to instantiate the formatter classes required for the argument parser.
+                Required for the correct formatting of the default parser values
+
+                Parameters
+                ----------
+                ArgumentDefaultsHelpFormatter object
+                    Instatiates the default values for the ArgumentParser for display on the command line.
+                RawDescriptionHelpFormatter object
+                    Ensures the correct display of the default values for the ArgumentParser
+                """
+        pass
+
+    parser = ArgumentParser(
+        description="Arborator, an aggregate tool for producing summary reports of genetic distances within groups v. {}".format(__version__),
+        formatter_class=CustomFormatter)
+    parser.add_argument(PROFILE_LONG, PROFILE_SHORT, type=str, required=True, help='Allelic profiles')
+    parser.add_argument(METADATA_LONG, METADATA_SHORT, type=str, required=True, help='Matched metadata for samples in the allele profile')
+    parser.add_argument(CONFIG_LONG, CONFIG_SHORT, type=str, required=False,
+                        help='Configuration json')
+    parser.add_argument(OUTDIR_LONG, OUTDIR_SHORT, type=str, required=True, help='Result output files')
+    parser.add_argument(PARTITION_COLUMN_LONG, PARTITION_COLUMN_SHORT, type=str, required=False,
+                        help=('Metadata column name for aggregating samples. Several columns delimited by , are each reported in their '
+                              'own subdirectory of the output directory, with the profiles loaded once and distances shared between them') )
+    parser.add_argument(ID_COLUMN_LONG, ID_COLUMN_SHORT, type=str, required=False, help='Sample identifier column' )
+    parser.add_argument(OUTLIER_THRESHOLD_LONG, type=float, required=False, help='Threshold to flag outlier comparisons within a group',default=100)
+    parser.add_argument(MINIMUM_MEMBERS_LONG, MINIMUM_MEMBERS_SHORT, type=int, required=False,
+                        help='Minimum number of members to perform clustering',default=2)
+    parser.add_argument(ONLY_REPORT_LABELED_LONG, required=False, help='Only report labeled columns',
+                        action='store_true')
+
+    #profile dists
+    parser.add_argument(COUNT_MISSING_LONG, COUNT_MISSING_SHORT, required=False, help='UNUSED: Count missing as differences',
+                        action='store_true')
+    parser.add_argument(MISSING_THRESHOLD_LONG, type=float, required=False,
+                        help='UNUSED: Maximum percentage of missing data allowed per locus (0 - 1)')
+    parser.add_argument(DISTANCE_METHOD_LONG, type=str, required=False, help='UNUSED: Distance method raw hamming or scaled difference [hamming, scaled]')
+    parser.add_argument(SKIP_QC_LONG, SKIP_QC_SHORT, required=False, help='UNUSED: Skip QA/QC steps',
+                        action='store_true')
+    #GAS
+    parser.add_argument(THRESHOLDS_LONG, THRESHOLDS_SHORT, type=str, required=False, help='thresholds delimited by ,',default='100')
+    parser.add_argument(DELIMITER_LONG, DELIMITER_SHORT, type=str, required=False, help='UNUSED: delimiter desired for nomenclature code')
+    parser.add_argument(CLUSTER_METHOD_LONG, CLUSTER_METHOD_SHORT, type=str, required=False, help='cluster method [single, complete, average]',
+                        default='average')
+    parser.add_argument(SWEEP_THRESHOLDS_LONG, type=str, required=False,
+                        help=('Sweep mode: threshold sets to compare, delimited by ; with the thresholds of a set delimited by , '
+                              '(e.g. "10,5,2;20,10,5"). Each group is also clustered with every combination of threshold set and '
+                              f'{SWEEP_METHODS_LONG} method, reusing its distance matrix, and one addresses table per combination and '
+                              'a comparison of their cluster counts are written to the sweep directory (default: --thresholds)'))
+    parser.add_argument(SWEEP_METHODS_LONG, type=str, required=False,
+                        help='Sweep mode: cluster methods to compare, delimited by , (default: --method)')
+    parser.add_argument(TREE_DISTANCES_LONG, type=str, required=False, default='patristic', choices=TREE_DISTANCES,
+                        help=('Defines how distances in distance matrices are interpretted by GAS and represented in the output tree (Newick file). '
+                             'Use "patristic" to interpret distances in the matrix as sum of branch lengths between clusters or leaves, '
+                             'and "cophenetic" to interpret distances in the matrix as the minimum distance two clusters or leaves need '
+                             'to be in order to be grouped into the same cluster.'))
+
+    parser.add_argument(INCREMENTAL_LONG, type=str, required=False,
+                        help=('Output directory of a previous run. Groups with the same members, profiles and parameters reuse '
+                              'the matrix, clusters, tree, loci summary and outliers of that run instead of being recomputed'))
+    parser.add_argument(DISTANCE_CACHE_LONG, type=str, required=False,
+                        help=('SQLite file used to cache pairwise distances between runs. Samples are identified by a hash of their '
+                              'profile and only pairs missing from the cache are computed'))
+    parser.add_argument(DISTANCE_CACHE_SIZE_LONG, type=int, required=False,
+                        help='Maximum number of pairwise distances kept in the distance cache, least recently used are removed first (default: unlimited)')
+    parser.add_argument(FORCE_LONG, FORCE_SHORT, required=False, help='Overwrite existing directory',
+                        action='store_true')
+    parser.add_argument(SORT_MATRIX_LONG, required=False,
+                        help=('Sorts the samples in the distance matrix generated by GAS. The order of sample rarely '
+                             'has an effect on the assigned cluster labels and sorting them ensures the same inputs always generate the same outputs.'),
+                        action='store_true')
+    parser.add_argument(SKIP_MATRIX_LONG, required=False,
+                        help=('Do not write the within group distance matrix (matrix.tsv). The matrix is kept in memory for '
+                             'clustering, statistics and outlier detection and is only written to disk at the end of each group.'),
+                        action='store_true')
+    parser.add_argument(CONDENSED_MATRIX_LONG, required=False,
+                        help=('Write the within group distance matrix as a condensed upper triangle (matrix.condensed.npy), '
+                              'in the scipy squareform layout with samples in the order of clusters.tsv'),
+                        action='store_true')
+    parser.add_argument(TILE_SIZE_LONG, type=float, required=False,
+                        help=('Out-of-core mode for groups larger than memory: the within group distance matrix is computed in tiles of '
+                              'rows into a memory-mapped file in the group directory, and statistics and outliers are computed tile by tile. '
+                              'Sets the working memory in MB of a tile (default: off)'))
+    parser.add_argument(PROFILE_RUN_LONG, required=False,
+                        help=('Write cProfile statistics of the run (profile.pstats) and of each group (profile.pstats in the group directory), '
+                              'which can be read with python -m pstats'),
+                        action='store_true')
+    parser.add_argument(EXCEL_LONG, type=str, required=False, default='memory', choices=EXCEL_MODES,
+                        help=('How the Excel reports are written: memory builds each workbook in memory with pandas, streaming writes rows to a '
+                              'write-only workbook with constant memory, background streams them in a background thread while the run '
+                              'continues and skip does not write them'))
+    parser.add_argument(PLAN_LONG, required=False,
+                        help=('Dry run: print the groups that would be clustered with their expected number of pairwise distances, '
+                              'memory and work, without computing or writing anything'),
+                        action='store_true')
+    parser.add_argument(VALIDATE_ONLY_LONG, required=False,
+                        help=('Check the parameters, the config and the headers of the input files without loading the data, '
+                              'then exit'),
+                        action='store_true')
+    parser.add_argument(THREADS_LONG, type=int, required=False,
+                        help='CPU Threads to use', default=1)
+    parser.add_argument(MAX_MEMORY_LONG, type=float, required=False,
+                        help=('Memory budget in GB for groups processed at the same time. Groups are started largest first and '
+                              'only while their estimated memory fits within the budget (default: available memory)'))
+    parser.add_argument(VERSION_LONG, VERSION_SHORT, action='version', version="%(prog)s " + __version__)
+
+    return parser
+
+def convert_to_bool(input):
+
+    if not isinstance(input, bool):
+            if str(input).lower() in TRUE_STRINGS:
+                result = True
+            elif str(input).lower() in FALSE_STRINGS:
+                result = False
+            else:
+                message = f'Expected a boolean-like string but found {input}'
+                raise Exception(message)
+    else:
+        result = input
+
+    return result
+
+def validate_params(config, in_memory=False):
+    params = [PROFILE_KEY, METADATA_KEY, OUTDIR_KEY, ID_COLUMN_KEY, PARTITION_COLUMN_KEY, MINIMUM_MEMBERS_KEY]
+    # A run through the Python API can be given its inputs as tables and does not need an output directory:
+    if in_memory:
+        params = [ID_COLUMN_KEY, PARTITION_COLUMN_KEY, MINIMUM_MEMBERS_KEY]
+    missing = []
+    for p in params:
+        if p not in config or config[p] == '' or config[p] == None:
+            missing.append(p)
+    if len(missing) > 0:
+        message = f"Error, parameters not set for: {missing}"
+        raise Exception(message)
+
+    for key in config.keys():
+        # Check for any unexpected config keys:
+        if key not in PARAMETER_KEYS:
+            print(f'WARNING: "{key}" parameter unrecognized')
+
+        # Convert string booleans into actual booleans:
+        if key in BOOLEAN_KEYS:
+            config[key] = convert_to_bool(config[key])
+
+    # Convert string booleans into actual booleans:
+    if GROUPED_METADATA_COLUMNS_KEY in config:
+        summaries = config[GROUPED_METADATA_COLUMNS_KEY]
+        for summary in summaries:
+            if DISPLAY_KEY in summaries[summary]:
+                display = summaries[summary][DISPLAY_KEY]
+                summaries[summary][DISPLAY_KEY] = convert_to_bool(display)
+
+    # Convert string booleans into actual booleans:
+    if LINELIST_COLUMNS_KEY in config:
+        summaries = config[LINELIST_COLUMNS_KEY]
+        for summary in summaries:
+            if DISPLAY_KEY in summaries[summary]:
+                display = summaries[summary][DISPLAY_KEY]
+                summaries[summary][DISPLAY_KEY] = convert_to_bool(display)
+
+def check_parameters(config, in_memory=False):
+    '''
+    Checks the run parameters and that the input files exist, without reading them
+    :param config: dict of parameters
+    :param in_memory: the profiles and metadata may be tables rather than files (None in config) and the outdir may be None
+    :return: dict of the checked parameters which are converted to numbers or lists
+    '''
+    profile_file = config[PROFILE_KEY]
+    partition_file = config[METADATA_KEY]
+    outdir = config[OUTDIR_KEY]
+    outlier_thresh = config[OUTLIER_THRESHOLD_KEY]
+    thresholds = config[THRESHOLDS_KEY]
+    method = config[CLUSTER_METHOD_KEY]
+    force = config[FORCE_KEY]
+    min_members = config[MINIMUM_MEMBERS_KEY]
+    num_threads = config[THREADS_KEY]
+    max_memory = config[MAX_MEMORY_KEY]
+    tile_size = config[TILE_SIZE_KEY]
+    excel_mode = config[EXCEL_KEY]
+    plan_only = config[PLAN_KEY]
+    previous_outdir = config[INCREMENTAL_KEY]
+    cache_size = config[DISTANCE_CACHE_SIZE_KEY]
+    num_shards = config.get(NUM_SHARDS_KEY)
+    partition_cols = get_partition_columns(config[PARTITION_COLUMN_KEY])
+    sweep_thresholds = config.get(SWEEP_THRESHOLDS_KEY)
+    sweep_methods = config.get(SWEEP_METHODS_KEY)
+
+    # Unused parameters:
+    skip_qc = config[SKIP_QC_KEY]
+    missing_thresh = config[MISSING_THRESHOLD_KEY]
+    distm = config[DISTANCE_METHOD_KEY]
+    count_missing = config[COUNT_MISSING_KEY]
+    delimiter = config[DELIMITER_KEY]
+
+    # We're leaving the skip_qc for later, but want to warn.
+    # Since it's in argparse as a flag, it will always be false
+    # if not provided.
+    if(skip_qc):
+        print(f'WARNING: skip QC ({SKIP_QC_LONG}/{SKIP_QC_SHORT}) was provided, but this parameter is currently unused.')
+
+    if(missing_thresh):
+        print(f'WARNING: missing threshold ({MISSING_THRESHOLD_LONG}) was provided, but this parameter is currently unused.')
+
+    if(distm):
+        print(f'WARNING: distance method ({DISTANCE_METHOD_LONG}) was provided, but this parameter is currently unused.')
+
+    # See above comment for skip_qc.
+    if(count_missing):
+        print(f'WARNING: count missing ({COUNT_MISSING_LONG}/{COUNT_MISSING_SHORT}) was provided, but this parameter is currently unused.')
+
+    if(delimiter):
+        print(f'WARNING: delimiter ({DELIMITER_LONG}/{DELIMITER_SHORT}) was provided, but this parameter is currently unused.')
+
+    try:
+        sys_num_cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        sys_num_cpus = cpu_count()
+
+    if num_threads < 1:
+        message = f'{THREADS_KEY} ({num_threads}) needs to be at least 1.'
+        raise Exception(message)
+    elif num_threads > sys_num_cpus:
+        print(f'WARNING: {THREADS_KEY} ({num_threads}) exceeds the number of CPUs available ({sys_num_cpus}). Setting {THREADS_KEY} to {sys_num_cpus}.')
+        num_threads = sys_num_cpus
+
+    if not (in_memory and profile_file is None) and not os.path.isfile(profile_file):
+        message = f'Profile path {profile_file} does not exist, please check path and try again'
+        raise Exception(message)
+
+    if not (in_memory and partition_file is None) and not os.path.isfile(partition_file):
+        message = f'Metadata file {partition_file} does not exist, please check path and try again'
+        raise Exception(message)
+
+    if outdir is None:
+        for (key, value) in [(NUM_SHARDS_KEY, num_shards), (INCREMENTAL_KEY, previous_outdir), (PROFILE_RUN_KEY, config[PROFILE_RUN_KEY])]:
+            if value is not None and value is not False:
+                message = f'{key} needs an {OUTDIR_KEY} to write to'
+                raise Exception(message)
+
+    if not isinstance(outlier_thresh,int) or not isinstance(outlier_thresh,float):
+        try:
+            outlier_thresh = float(outlier_thresh)
+        except:
+            message = f'Outlier threshold needs to be numeric: {outlier_thresh}'
+            raise Exception(message)
+
+    if not isinstance(thresholds,list):
+        thresholds = thresholds.split(',')
+
+    sweep = get_sweep(thresholds, method, sweep_thresholds, sweep_methods)
+    thresholds = process_thresholds(thresholds)
+
+    if not method in CLUSTER_METHODS:
+        message = f'Linkage method supplied is invalid: {method}, it needs to be one of average, single, complete'
+        raise Exception(message)
+
+    if not isinstance(min_members, int):
+        try:
+            min_members = int(min_members)
+        except:
+            message = f'Min members needs to be an integer {min_members}'
+            raise Exception(message)
+
+    if min_members < 2:
+        message = f'{MINIMUM_MEMBERS_KEY} ({min_members}) needs to be at least 2.'
+        raise Exception(message)
+
+    if max_memory is not None:
+        try:
+            max_memory = float(max_memory)
+        except:
+            message = f'{MAX_MEMORY_KEY} needs to be numeric: {max_memory}'
+            raise Exception(message)
+
+        if max_memory <= 0:
+            message = f'{MAX_MEMORY_KEY} ({max_memory}) needs to be greater than 0.'
+            raise Exception(message)
+
+        # GB to bytes:
+        max_memory = int(max_memory * 1024 ** 3)
+
+    if tile_size is not None:
+        try:
+            tile_size = float(tile_size)
+        except:
+            message = f'{TILE_SIZE_KEY} needs to be numeric: {tile_size}'
+            raise Exception(message)
+
+        if tile_size <= 0:
+            message = f'{TILE_SIZE_KEY} ({tile_size}) needs to be greater than 0.'
+            raise Exception(message)
+
+        # MB to bytes:
+        tile_size = int(tile_size * 1024 ** 2)
+
+    if cache_size is not None:
+        try:
+            cache_size = int(cache_size)
+        except:
+            message = f'{DISTANCE_CACHE_SIZE_KEY} needs to be an integer: {cache_size}'
+            raise Exception(message)
+
+        if cache_size < 0:
+            message = f'{DISTANCE_CACHE_SIZE_KEY} ({cache_size}) needs to be at least 0.'
+            raise Exception(message)
+
+    if num_shards is not None:
+        if not isinstance(num_shards, int):
+            try:
+                num_shards = int(num_shards)
+            except:
+                message = f'{NUM_SHARDS_KEY} needs to be an integer: {num_shards}'
+                raise Exception(message)
+
+        if num_shards < 1:
+            message = f'{NUM_SHARDS_KEY} ({num_shards}) needs to be at least 1.'
+            raise Exception(message)
+
+        if len(partition_cols) > 1:
+            message = f'Only one {PARTITION_COLUMN_KEY} can be split into shards, {len(partition_cols)} were given: {", ".join(partition_cols)}'
+            raise Exception(message)
+
+    if excel_mode not in EXCEL_MODES:
+        message = f'{EXCEL_KEY} ({excel_mode}) needs to be one of {", ".join(EXCEL_MODES)}.'
+        raise Exception(message)
+
+    if previous_outdir is not None and not os.path.isdir(previous_outdir):
+        message = f'Previous output directory {previous_outdir} does not exist, please check path and try again'
+        raise Exception(message)
+
+    if outdir is not None and not plan_only and not force and os.path.isdir(outdir):
+        message = f'folder {outdir} already exists, please choose new directory or use --force'
+        raise Exception(message)
+
+    return {
+        OUTLIER_THRESHOLD_KEY: outlier_thresh,
+        THRESHOLDS_KEY: thresholds,
+        MINIMUM_MEMBERS_KEY: min_members,
+        THREADS_KEY: num_threads,
+        MAX_MEMORY_KEY: max_memory,
+        TILE_SIZE_KEY: tile_size,
+        DISTANCE_CACHE_SIZE_KEY: cache_size,
+        NUM_SHARDS_KEY: num_shards,
+        SWEEP_KEY: sweep,
+    }
+
+def read_header(f):
+    '''
+    Reads the column names of an input file, only the schema of parquet and arrow files is read
+    :param f: string path to file
+    :return: list of column names
+    '''
+    extension = os.path.splitext(f)[1].lstrip('.').lower()
+    if extension in EXTENSIONS['parquet'] + EXTENSIONS['arrow']:
+        from arborator.classes.read_data import read_data
+        return read_data.get_columns(f, read_data.get_format(f))
+
+    with open(f) as fh:
+        return fh.readline().rstrip('\r\n').split("\t")
+
+def validate_inputs(config):
+    '''
+    Checks the parameters, the config and the headers of the input files, without loading the data
+    :param config: dict of parameters
+    :return: None
+    '''
+    validate_params(config)
+    check_parameters(config)
+    id_col = config[ID_COLUMN_KEY]
+    partition_cols = get_partition_columns(config[PARTITION_COLUMN_KEY])
+
+    profile_columns = read_header(config[PROFILE_KEY])
+    if len(profile_columns) < 2:
+        message = f'Profile file {config[PROFILE_KEY]} needs a sample id column followed by at least one locus column'
+        raise Exception(message)
+
+    metadata_columns = read_header(config[METADATA_KEY])
+    for col in [id_col] + partition_cols:
+        if col not in metadata_columns:
+            message = f'the column {col} does not exist in the metadata file {config[METADATA_KEY]}'
+            raise Exception(message)
+
+    if LINELIST_COLUMNS_KEY in config:
+        for col in config[LINELIST_COLUMNS_KEY]:
+            if col != GAS_CLUSTER_ADDRESS_KEY and col not in metadata_columns:
+                print(f'WARNING: "{col}" specified in the line list, but does not exist in the metadata.')
+
+    print(f'Validation passed: {len(profile_columns) - 1} loci and {len(metadata_columns)} metadata columns')
+
+def get_partition_columns(partition_col):
+    '''
+    Splits the partition column parameter into its columns
+    :param partition_col: str partition column, or several delimited by , (or a list)
+    :return: list of unique partition columns, in the order given
+    '''
+    if not isinstance(partition_col, list):
+        partition_col = str(partition_col).split(',')
+
+    partition_cols = []
+    for col in partition_col:
+        col = str(col).strip()
+        if col != '' and col not in partition_cols:
+            partition_cols.append(col)
+
+    if len(partition_cols) == 0:
+        message = f'{PARTITION_COLUMN_KEY} needs at least one column: {partition_col}'
+        raise Exception(message)
+
+    return partition_cols
+
+def get_sweep(thresholds, method, sweep_thresholds=None, sweep_methods=None):
+    '''
+    Creates the combinations of threshold sets and cluster methods of a sweep
+    :param thresholds: list of the run's thresholds, used when no threshold sets are given
+    :param method: str the run's cluster method, used when no methods are given
+    :param sweep_thresholds: str threshold sets delimited by ; (or a list of sets), None for no sweep
+    :param sweep_methods: str cluster methods delimited by , (or a list), None for no sweep
+    :return: list of (label, method, list of thresholds), None if there is no sweep
+    '''
+    if sweep_thresholds is None and sweep_methods is None:
+        return None
+
+    threshold_sets = [thresholds]
+    if sweep_thresholds is not None:
+        if not isinstance(sweep_thresholds, list):
+            sweep_thresholds = sweep_thresholds.split(';')
+        threshold_sets = []
+        for t in sweep_thresholds:
+            if not isinstance(t, list):
+                t = t.split(',')
+            threshold_sets.append([str(x).strip() for x in t])
+
+    methods = [method]
+    if sweep_methods is not None:
+        if not isinstance(sweep_methods, list):
+            sweep_methods = sweep_methods.split(',')
+        methods = [x.strip() for x in sweep_methods]
+
+    sweep = []
+    labels = set()
+    for m in methods:
+        if not m in CLUSTER_METHODS:
+            message = f'Linkage method supplied is invalid: {m}, it needs to be one of average, single, complete'
+            raise Exception(message)
+        for t in threshold_sets:
+            label = f"{m}.{'_'.join([str(x).strip() for x in t])}"
+            if label in labels:
+                continue
+            labels.add(label)
+            sweep.append((label, m, process_thresholds(t)))
+
+    return sweep
+
+def process_thresholds(thresholds):
+
+    try:
+        processed = [float(x) for x in thresholds]
+    except ValueError:
+        message = f'thresholds {thresholds} must all be integers or floats'
+        raise Exception(message)
+
+    # Thresholds must be strictly decreasing:
+    if not all(processed[i] > processed[i+1] for i in range(len(processed)-1)):
+        message = f'thresholds {thresholds} must be in decreasing order'
+        raise Exception(message)
+
+    # Thresholds must be non-negative:
+    if not all(processed[i] >= 0 for i in range(len(processed))):
+        message = f'thresholds {thresholds} must be non-negative'
+        raise Exception(message)
+
+    return processed
+
+def get_config(config):
+    '''
+    Overwrites the command line parameters with the parameters of the config file, if one is given
+    :param config: dict of command line parameters
+    :return: dict of parameters
+    '''
+    config_file = config[CONFIG_KEY]
+
+    # Overwrite with config file parameters:
+    if config_file is not None:
+
+        if not os.path.isfile(config_file):
+            message = f'Config path {config_file} does not exist, please check path and try again'
+            raise Exception(message)
+
+        with open(config_file) as fh:
+            c = json.loads(fh.read())
+            for field in c:
+                config[field] = c[field]
+
+    if not OUTLIER_THRESHOLD_KEY in config or config[OUTLIER_THRESHOLD_KEY] == '':
+        message = 'Error you must supply an outlier threshold as a cmd line parameter or in the config file'
+        raise Exception(message)
+
+    if not THRESHOLDS_KEY in config or config[THRESHOLDS_KEY] == '':
+        message = 'Error you must supply a threshold as a cmd line parameter or in the config file'
+        raise Exception(message)
+
+    return config
@@ -0,0 +1,1499 @@
+import copy
+import cProfile
+import time
+import json
+import os
+import re
+import sys
+import shutil
+import tempfile
+from datetime import datetime
+import pandas as pd
+import numpy as np
+from arborator.classes.aggregator import summarizer
+from profile_dists.utils import (get_distance_raw, process_profile, guess_format, convert_allele_codes, update_column_map,
+                                 List, MISSING_ALLELE)
+from arborator.classes.read_data import read_data
+from arborator.classes.report import report
+from arborator.classes.split_profiles import split_profiles
+from arborator.classes.matrix_clustering import matrix_clustering
+from arborator.classes.clustering_sweep import clustering_sweep
+from arborator.classes.shared_profiles import shared_profiles
+from arborator.classes.scheduler import scheduler
+from arborator.classes.incremental import incremental
+from arborator.classes.distance_cache import distance_cache
+from arborator.classes.distance_store import distance_store
+from arborator.classes.condensed_matrix import condensed_matrix
+from arborator.classes.stage_timer import stage_timer
+from arborator.classes.output_writer import output_writer
+from arborator.classes.shards import shards
+from arborator.parameters import (validate_params, check_parameters, get_partition_columns)
+from arborator.constants import (CLUSTER_METHOD_KEY, CLUSTER_SUMMARY_FILEPATH_EXCEL, CLUSTER_SUMMARY_FILEPATH_TSV,
+                                 CLUSTER_SUMMARY_SHEET_NAME, CONDENSED_MATRIX_KEY, CONFIG_KEY, DISPLAY_KEY,
+                                 DISTANCE_CACHE_KEY, DISTANCE_CACHE_SIZE_KEY, EXCEL_KEY, FORCE_KEY,
+                                 GAS_CLUSTER_ADDRESS_KEY, GROUPED_METADATA_COLUMNS_KEY, ID_COLUMN_KEY, INCREMENTAL_KEY,
+                                 LABEL_KEY, LINELIST_COLUMNS_KEY, MAX_MEMORY_KEY, METADATA_INCLUDED_FILEPATH_EXCEL,
+                                 METADATA_INCLUDED_FILEPATH_TSV, METADATA_INCLUDED_SHEET_NAME, METADATA_KEY,
+                                 MINIMUM_MEMBERS_KEY, NUM_SHARDS_KEY, ONLY_REPORT_LABELED_KEY, OUTDIR_KEY,
+                                 OUTLIER_THRESHOLD_KEY, PARTITION_COLUMN_KEY, PLAN_KEY, PROFILE_KEY, PROFILE_RUN_KEY,
+                                 PROFILE_STATS_FILE, SKIP_MATRIX_KEY, SORT_MATRIX_KEY, SWEEP_COUNTS_FILEPATH_TSV,
+                                 SWEEP_DIRECTORY, SWEEP_KEY, THREADS_KEY, THRESHOLDS_KEY, TILE_SIZE_KEY,
+                                 TREE_DISTANCES_KEY)
+from genomic_address_service.utils import format_threshold_map
+from numba import jit
+from multiprocessing import Pool, cpu_count
+from queue import Queue
+
+# Number of sample matrix cells held at a time when the matrix is processed in blocks of rows
+MATRIX_BLOCK_CELLS = 2 ** 22
+# Working memory per matrix cell of a tile with --tile_size, dominated by the int64 positions of a block
+TILE_BYTES_PER_CELL = 40
+
+def remove_columns(df,missing_value,max_missing_frac=1):
+    if max_missing_frac != 1:
+        columns = list(df.columns)
+        columns_to_remove = []
+        num_records = len(df)
+        for col in columns:
+            unique_values = dict(df[col].astype(str).value_counts())
+            if missing_value in unique_values:
+                n = unique_values[missing_value]
+                frac = n / num_records
+                if frac > max_missing_frac:
+                    columns_to_remove.append(col)
+
+        return df.drop(columns_to_remove, axis=1)
+    else:
+        columns_to_remove = []
+        return df.drop(columns_to_remove, axis=1)
+
+def load_profiles(profile_file):
+    '''
+    Reads and encodes the allele profiles. Text files are encoded by profile_dists, columnar (parquet, arrow) files and
+    in-memory tables are read through pyarrow and profiles which are already non-negative integer allele codes are used as
+    they are, otherwise they are encoded the same way as text files
+    :param profile_file: path to the profile file, or a pandas DataFrame or pyarrow Table, the first column is the sample id
+    :return: (dict of locus: {allele: code}, pd.DataFrame of allele codes indexed by sample id)
+    '''
+    if not isinstance(profile_file, str):
+        df = read_data.convert_table(read_data.to_arrow(profile_file), keep_int=True)
+    elif read_data.get_format(profile_file) == 'text':
+        return process_profile(profile_file, column_mapping={})
+    else:
+        df = read_data.read_table(profile_file, read_data.get_format(profile_file), keep_int=True)
+    index = df.iloc[:, 0].astype(str)
+    df = df.iloc[:, 1:]
+    df = df.set_index(index)
+
+    # Negative values are not allele codes (0 is missing), such profiles are encoded like text profiles:
+    if all(dtype.kind in 'iu' for dtype in df.dtypes) and (df.size == 0 or df.min().min() >= 0):
+        return ({}, df)
+
+    column_mapping = {}
+    df = df.astype(str).where(df.notna(), np.nan)
+    df = df.fillna(MISSING_ALLELE)
+    for value in ['?', ' ', '-', '', '_']:
+        df = df.replace(value, MISSING_ALLELE, regex=False)
+
+    for column in df.columns:
+        unique_col_values = sorted(df[column].unique().tolist())
+        method = guess_format(List(unique_col_values))
+        column_mapping[column] = {}
+        update_column_map(column_mapping[column], convert_allele_codes(unique_col_values, method))
+        df[column] = df[column].map(column_mapping[column])
+
+    return (column_mapping, df)
+
+@jit(nopython=True, cache=True)
+def calc_distances(profiles, distances, start, end):
+    '''
+    Calculates the pairwise hamming distances (missing data ignored) of the profiles start to end (exclusive)
+    to the profiles after them
+    :param profiles: 2D numpy array of integer allele profiles
+    :param distances: condensed numpy array of the distances of the rows start to end, updated in place
+    :param start: int first row
+    :param end: int row after the last row
+    :return: distances
+    '''
+    num_profiles = profiles.shape[0]
+    n = 0
+    for i in range(start, end):
+        for k in range(i + 1, num_profiles):
+            distances[n] = get_distance_raw(profiles[i], profiles[k])
+            n += 1
+    return distances
+
+@jit(nopython=True, cache=True)
+def fill_distances(profiles, distances, known, start, end):
+    '''
+    Calculates the pairwise hamming distances (missing data ignored) of the profiles start to end (exclusive)
+    that are not already known
+    :param profiles: 2D numpy array of integer allele profiles
+    :param distances: condensed numpy array of the distances of the rows start to end, updated in place
+    :param known: condensed numpy boolean array of the distances which are already filled in, for the same rows
+    :param start: int first row
+    :param end: int row after the last row
+    :return: int number of distances calculated
+    '''
+    count = 0
+    num_profiles = profiles.shape[0]
+    n = 0
+    for i in range(start, end):
+        for k in range(i + 1, num_profiles):
+            if not known[n]:
+                distances[n] = get_distance_raw(profiles[i], profiles[k])
+                count += 1
+            n += 1
+    return count
+
+def collapse_profiles(profiles):
+    '''
+    Collapses identical profiles
+    :param profiles: 2D numpy array of integer allele profiles
+    :return: (unique profiles, index of the first row of each unique profile,
+              index of the unique profile of each row, number of rows of each unique profile)
+    '''
+    unique_profiles, first, inverse, counts = np.unique(profiles, axis=0, return_index=True,
+                                                        return_inverse=True, return_counts=True)
+    return (unique_profiles, first, inverse.reshape(-1), counts)
+
+def get_distance_matrix(profiles, profile_hashes=None, cache=None, tile_cells=None, scratch_dir=None):
+    '''
+    Calculates the distance matrix of the profiles, reusing the distances available in the cache
+    :param profiles: 2D numpy array of unique integer allele profiles
+    :param profile_hashes: list of profile hashes, one per row, required with a cache
+    :param cache: distance_cache object or None
+    :param tile_cells: int maximum number of distances calculated per tile of rows, all at once if None
+    :param scratch_dir: directory of the memory-mapped file holding the matrix, held in memory if None
+    :return: (condensed_matrix of distances, dict of cache statistics)
+    '''
+    num_profiles = profiles.shape[0]
+    # Distances can not exceed the number of loci:
+    dtype = condensed_matrix.get_dtype(profiles.shape[1])
+    matrix = condensed_matrix.create(num_profiles, dtype, scratch_dir)
+    known = None
+    if cache is not None:
+        profile_ids = cache.get_profile_ids(profile_hashes)
+        known = condensed_matrix.create(num_profiles, bool, scratch_dir)
+        cache.get_distances(profile_ids, matrix.distances, known.distances)
+
+    misses = 0
+    for start, end in matrix.get_tiles(tile_cells):
+        if known is None:
+            calc_distances(profiles, matrix.get_tile(start, end), start, end)
+        else:
+            misses += fill_distances(profiles, matrix.get_tile(start, end), known.get_tile(start, end), start, end)
+        matrix.flush()
+
+    if cache is None:
+        matrix.compact()
+        return (matrix, {})
+
+    cache.add_distances(profile_ids, matrix.distances, known.distances)
+    hits = len(matrix.distances) - misses
+    matrix.compact()
+
+    return (matrix, {'distance_cache_hits': hits, 'distance_cache_misses': misses})
+
+def get_outliers(labels, distance_matrix, inverse, thresh, outfile, block_cells=MATRIX_BLOCK_CELLS, pairs=None):
+    # distance_matrix is a condensed_matrix between unique profiles, inverse maps each sample to its unique profile.
+    # Samples are processed in blocks of rows so that only one block of the sample matrix exists at a time.
+    # Pairwise outliers from the upper triangle are streamed to outfile (if not None) and appended to pairs
+    # (if not None) as (id1, id2, dist), the row sums for the average outliers are taken from the same blocks.
+    num_samples = len(labels)
+    block_size = max(1, block_cells // max(num_samples, 1))
+    columns = np.arange(num_samples)
+    row_sums = np.zeros(num_samples, dtype=np.int64)
+    num_pairwise = 0
+
+    fh = None
+    if outfile is not None:
+        fh = open(outfile, 'w')
+        fh.write("id1\tid2\tdist\n")
+    try:
+        for start in range(0, num_samples, block_size):
+            end = min(start + block_size, num_samples)
+            block = distance_matrix.get_block(inverse[start:end], inverse)
+            row_sums[start:end] = block.sum(axis=1, dtype=np.int64)
+
+            # Upper triangle of the sample matrix to avoid duplicates:
+            upper = columns[np.newaxis, :] > columns[start:end, np.newaxis]
+            rows, cols = np.nonzero(upper & (block != 0) & (block > thresh))
+            if len(rows) == 0:
+                continue
+            dists = block[rows, cols].tolist()
+            rows = (rows + start).tolist()
+            if fh is not None:
+                fh.write("".join([f"{labels[i]}\t{labels[k]}\t{float(d)}\n" for i, k, d in zip(rows, cols.tolist(), dists)]))
+            if pairs is not None:
+                pairs.extend([(labels[i], labels[k], float(d)) for i, k, d in zip(rows, cols.tolist(), dists)])
+            num_pairwise += len(dists)
+    finally:
+        if fh is not None:
+            fh.close()
+
+    # Dividing by num_samples - 1, because the distance matrix
+    # includes the distance of each sample to itself (0):
+    averages = row_sums / (num_samples - 1)
+    average_outliers_list = [labels[i] for i in np.flatnonzero(np.abs(averages) > thresh)]
+
+    return (average_outliers_list, num_pairwise)
+
+def get_distance_stats(distance_matrix, counts, tile_cells=None):
+    # Number of sample pairs at each distance, each unique profile stands for counts[i] samples.
+    histogram = distance_matrix.get_histogram(counts, tile_cells)
+    dists = np.flatnonzero(histogram)
+    positions = np.cumsum(histogram[dists])
+    num_pairs = positions[-1]
+
+    def get_nth(n):
+        return dists[np.searchsorted(positions, n, side='right')]
+
+    if num_pairs % 2 == 1:
+        median = get_nth(num_pairs // 2)
+    else:
+        median = (get_nth(num_pairs // 2 - 1) + get_nth(num_pairs // 2)) / 2
+
+    return {
+        'min': float(dists[0]),
+        'mean': float((dists * histogram[dists]).sum() / num_pairs),
+        'median': float(median),
+        'max': float(dists[-1]),
+    }
+
+def write_matrix(labels, distance_matrix, inverse, outfile, block_cells=MATRIX_BLOCK_CELLS):
+    # distance_matrix is a condensed_matrix between unique profiles, written in blocks of rows of the sample matrix.
+    PROFILE_DISTS_ID_INDEX = "dists" # This is not exposed in profile_dists.
+    num_samples = len(labels)
+    block_size = max(1, block_cells // max(num_samples, 1))
+    with open(outfile, 'w') as fh:
+        fh.write("\t".join([PROFILE_DISTS_ID_INDEX] + [str(x) for x in labels]) + "\n")
+        for start in range(0, num_samples, block_size):
+            end = min(start + block_size, num_samples)
+            df = pd.DataFrame(distance_matrix.get_block(inverse[start:end], inverse), index=labels[start:end])
+            df.to_csv(fh, sep="\t", header=False, index=True)
+
+def get_metadata_groups(groups, metadata_df, id_col):
+    '''
+    Assigns the metadata rows to their group in a single pass
+    :param groups: dict of group id: pd of the group's samples
+    :param metadata_df: pd metadata
+    :param id_col: str sample id column
+    :return: pd.Series of the group id of each metadata row, NaN for rows in no group
+    '''
+    sample_groups = {}
+    for group_id in groups:
+        for sample_id in groups[group_id][id_col]:
+            sample_groups[sample_id] = group_id
+    return metadata_df[id_col].map(sample_groups)
+
+def plan_groups(group_rows, min_members):
+    '''
+    Splits the groups by size before any data is staged, only groups with at least min_members are clustered
+    :param group_rows: dict of group id: array of the profile rows of the group
+    :param min_members: int minimum number of members for a group to be clustered
+    :return: (list of group ids to cluster, set of group ids below min_members)
+    '''
+    clustered = []
+    skipped = set()
+    for group_id in group_rows:
+        if len(group_rows[group_id]) >= min_members:
+            clustered.append(group_id)
+        else:
+            skipped.add(group_id)
+    return (clustered, skipped)
+
+def get_skipped_group_metrics(num_members):
+    # The metrics process_group reports for a group too small to be clustered:
+    return {
+        'count_members': num_members,
+        'min_dist': 0,
+        'mean_dist': 0,
+        'median_dist': 0,
+        'max_dist': 0,
+        'count_outliers': 0,
+        'outlier_ids': "",
+        'addresses': ([], []),
+    }
+
+def print_plan(group_rows, clustered, group_file_mapping, num_loci, min_members, max_memory=None, tile_size=None):
+    '''
+    Prints the expected number of pairwise distances, memory and work of each group, in group order
+    :param group_rows: dict of group id: array of the profile rows of the group
+    :param clustered: list of group ids to cluster
+    :param group_file_mapping: dict of group id: directory name
+    :param num_loci: int number of loci in the profiles
+    :param min_members: int minimum number of members for a group to be clustered
+    :param max_memory: memory budget in bytes, defaults to the available memory
+    :param tile_size: working memory in bytes of a tile when groups are processed out-of-core, None when in memory
+    :return: None
+    '''
+    group_sizes = {}
+    for group_id in clustered:
+        group_sizes[group_id] = len(group_rows[group_id])
+    plan = scheduler(group_sizes, num_loci, min_members=min_members, max_memory=max_memory, tile_size=tile_size)
+    estimates = plan.get_estimates()
+    tasks = plan.get_tasks()
+
+    lines = ["\t".join(['group_id', 'directory', 'count_members', 'clustered', 'count_pairs', 'memory_mb', 'cost'])]
+    for group_id in group_rows:
+        estimate = {'count_pairs': 0, 'memory': 0, 'cost': 0}
+        if group_id in estimates:
+            estimate = estimates[group_id]
+        lines.append("\t".join([str(group_id), group_file_mapping[group_id], str(len(group_rows[group_id])), str(group_id in estimates),
+                                str(estimate['count_pairs']), f"{estimate['memory'] / 1024 ** 2:.3f}", str(estimate['cost'])]))
+    print("\n".join(lines))
+
+    largest = max([task['memory'] for task in tasks], default=0)
+    print(f"Groups to cluster: {len(clustered)}, groups below {MINIMUM_MEMBERS_KEY} ({min_members}): {len(group_rows) - len(clustered)}")
+    print(f"Pairwise distances: {sum(estimates[x]['count_pairs'] for x in estimates)}, tasks: {len(tasks)}, "
+          f"largest task memory: {largest / 1024 ** 2:.3f} MB, memory budget: {plan.max_memory / 1024 ** 2:.3f} MB")
+
+def plan_shards(config, group_rows, clustered, group_file_mapping, num_loci, num_shards, min_members, tile_size=None, dry_run=False):
+    '''
+    Assigns the groups to cluster to shards and writes the shard manifest used by arborator run-shard and merge
+    :param config: dict of run parameters
+    :param group_rows: dict of group id: array of the profile rows of the group
+    :param clustered: list of group ids to cluster
+    :param group_file_mapping: dict of group id: directory name
+    :param num_loci: int number of loci in the profiles
+    :param num_shards: int number of shards
+    :param min_members: int minimum number of members for a group to be clustered
+    :param tile_size: working memory in bytes of a tile when groups are processed out-of-core, None when in memory
+    :param dry_run: bool only print the shards
+    :return: dict manifest
+    '''
+    group_sizes = {}
+    for group_id in clustered:
+        group_sizes[group_id] = len(group_rows[group_id])
+    estimates = scheduler(group_sizes, num_loci, min_members=min_members, tile_size=tile_size).get_estimates()
+
+    # Shards may run from other working directories:
+    parameters = dict(config)
+    del(parameters[NUM_SHARDS_KEY])
+    for key in [PROFILE_KEY, METADATA_KEY, CONFIG_KEY, OUTDIR_KEY, INCREMENTAL_KEY, DISTANCE_CACHE_KEY]:
+        if parameters.get(key) is not None:
+            parameters[key] = os.path.abspath(parameters[key])
+
+    sharding = shards(config[OUTDIR_KEY])
+    manifest = sharding.plan(parameters, estimates, group_file_mapping, num_shards)
+    for shard in manifest['shards']:
+        print(f"Shard {shard['index']}: {len(shard['group_ids'])} groups, {shard['count_members']} members, "
+              f"{shard['count_pairs']} pairwise distances, largest group memory: {shard['memory'] / 1024 ** 2:.3f} MB, cost: {shard['cost']}")
+    if not dry_run:
+        sharding.write_manifest()
+        print(f"Shard manifest written to {sharding.get_manifest_path()}")
+    return manifest
+
+def stage_data(groups, outdir, group_file_mapping, carried_over=[]):
+    files = {}
+    for group_id in groups:
+        directory_name = group_file_mapping[group_id]
+        directory_path = os.path.join(outdir,f"{directory_name}")
+
+        if not os.path.isdir(directory_path):
+            os.makedirs(directory_path, 0o755)
+
+        files[group_id] = {
+            "matrix": os.path.join(directory_path, "matrix.tsv"),
+            "condensed_matrix": os.path.join(directory_path, "matrix.condensed.npy"),
+            "clusters": os.path.join(directory_path, "clusters.tsv"),
+            "metadata": os.path.join(directory_path, "metadata.tsv"),
+            "tree": os.path.join(directory_path, "tree.nwk"),
+            "summary": os.path.join(directory_path, "loci.summary.tsv"),
+            "outliers": os.path.join(directory_path, "outliers.tsv"),
+            "profile": os.path.join(directory_path, PROFILE_STATS_FILE),
+
+        }
+
+        #remove existing files if they exist, results carried over from a previous run in place are kept
+        for fname in files[group_id]:
+            if group_id in carried_over and fname != METADATA_KEY:
+                continue
+            if os.path.isfile(files[group_id][fname]):
+                os.remove(files[group_id][fname])
+
+    return files
+
+# Populated in each worker process by init_shared_profiles
+SHARED_PROFILES = {}
+
+def init_shared_profiles(name, shape, dtype, sample_ids, loci, profile_hashes=None, cache_file=None, store=None):
+    SHARED_PROFILES['profiles'] = shared_profiles(shape, dtype, name=name)
+    SHARED_PROFILES['sample_ids'] = sample_ids
+    SHARED_PROFILES['loci'] = loci
+    SHARED_PROFILES['profile_hashes'] = profile_hashes
+    SHARED_PROFILES['distance_cache'] = store
+    if cache_file is not None:
+        SHARED_PROFILES['distance_cache'] = distance_cache(cache_file)
+
+def process_shared_groups(group_ids, group_rows, group_files, submit_time, *args, sweep=None, keep_outputs=False):
+    sample_ids = SHARED_PROFILES['sample_ids']
+    all_hashes = SHARED_PROFILES['profile_hashes']
+    results = []
+    for group_id in group_ids:
+        # Time since the task was submitted, including the earlier groups of a batch:
+        queue_wait = time.time() - submit_time
+        rows = group_rows[group_id]
+        labels = [sample_ids[i] for i in rows]
+        profiles = SHARED_PROFILES['profiles'].get_rows(rows)
+        profile_hashes = None
+        if all_hashes is not None:
+            profile_hashes = [all_hashes[i] for i in rows]
+        result = process_group(group_id, labels, profiles, SHARED_PROFILES['loci'], group_files[group_id], *args, sweep=sweep,
+                               keep_outputs=keep_outputs, distance_cache=SHARED_PROFILES['distance_cache'], profile_hashes=profile_hashes)
+        result[group_id]['run_data']['queue_wait_s'] = round(queue_wait, 6)
+        results.append(result)
+
+    return results
+
+def process_data(group_files, group_rows, profiles, sample_ids, loci, id_col, group_col, thresholds, outlier_thresh,
+                 method, min_members, tree_distance_representation, sort_matrix, skip_matrix=False, write_condensed=False, tile_size=None, profile_run=False, num_cpus=1,
+                 max_memory=None, profile_hashes=None, cache_file=None, store=None, sweep=None, keep_outputs=False):
+    if len(group_files) == 0:
+        return []
+
+    try:
+        sys_num_cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        sys_num_cpus = cpu_count()
+
+    if num_cpus > sys_num_cpus:
+        num_cpus = sys_num_cpus
+
+    group_sizes = {}
+    for group_id in group_files:
+        group_sizes[group_id] = len(group_rows[group_id])
+    tasks = scheduler(group_sizes, len(loci), min_members=min_members, max_memory=max_memory, tile_size=tile_size)
+    budget = tasks.max_memory
+    tasks = tasks.get_tasks()
+    num_cpus = max(min(num_cpus, len(tasks)), 1)
+
+    # Encoded profiles are shared with the workers rather than staged to disk or pickled:
+    shared = shared_profiles(profiles.shape, profiles.dtype)
+    shared.profiles[:] = profiles
+
+    try:
+        pool = Pool(processes=num_cpus, initializer=init_shared_profiles,
+                    initargs=(shared.name, shared.shape, shared.dtype.str, sample_ids, loci, profile_hashes, cache_file, store))
+
+        # Tasks are submitted largest first, as long as the running tasks fit in the memory budget.
+        # A task that exceeds the budget on its own is run once nothing else is running.
+        finished = Queue()
+        running = {}
+        memory_used = 0
+        results = []
+        for i, task in enumerate(tasks):
+            while len(running) > 0 and memory_used + task['memory'] > budget:
+                memory_used -= running.pop(finished.get())
+
+            group_ids = task['group_ids']
+            task_rows = {}
+            task_files = {}
+            for group_id in group_ids:
+                task_rows[group_id] = group_rows[group_id]
+                task_files[group_id] = group_files[group_id]
+
+            running[i] = task['memory']
+            memory_used += task['memory']
+            results.append(pool.apply_async(process_shared_groups, (group_ids, task_rows, task_files, time.time(), id_col, group_col,
+                                                                    thresholds, outlier_thresh, method,
+                                                                    tree_distance_representation, sort_matrix,
+                                                                    min_members, skip_matrix, write_condensed, tile_size,
+                                                                    profile_run),
+                                            {'sweep': sweep, 'keep_outputs': keep_outputs},
+                                            callback=lambda x, i=i: finished.put(i),
+                                            error_callback=lambda e, i=i: finished.put(i)))
+
+        pool.close()
+        pool.join()
+
+        group_results = {}
+        for x in results:
+            for group_result in x.get():
+                group_results.update(group_result)
+    finally:
+        shared.close()
+        shared.unlink()
+
+    # Keep the original group order for reporting:
+    r = []
+    for group_id in group_files:
+        r.append({group_id: group_results[group_id]})
+
+    return r
+
+def process_group(group_id, labels, profiles, loci, output_files, id_col, group_col, thresholds,
+                  outlier_thresh, method, tree_distance_representation,
+                  sort_matrix, min_members=2, skip_matrix=False, write_condensed=False, tile_size=None, profile_run=False,
+                  max_missing_frac=1, distance_cache=None, profile_hashes=None, sweep=None, keep_outputs=False):
+    # Without output_files nothing is written, keep_outputs returns the tree and pairwise outliers of the group
+    profiler = None
+    if profile_run:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    timer = stage_timer()
+
+    df = pd.DataFrame(profiles, index=labels, columns=loci)
+    df = remove_columns(df, '0', max_missing_frac=max_missing_frac)
+    min_dist = 0
+    mean_dist = 0
+    med_dist = 0
+    max_dist = 0
+    outlier_ids = []
+    addresses = ([], [])
+    sweep_addresses = None
+    outputs = None
+    group_run_data = {}
+    if len(labels) >= min_members:
+        tile_cells = None
+        block_cells = MATRIX_BLOCK_CELLS
+        scratch_dir = None
+        if tile_size is not None:
+            # out-of-core, the matrices are memory-mapped files in the group directory and are processed in tiles
+            tile_cells = max(1, tile_size // TILE_BYTES_PER_CELL)
+            block_cells = tile_cells
+            scratch_dir = os.path.dirname(output_files['clusters']) if output_files is not None else tempfile.gettempdir()
+
+        with timer.stage('distance'):
+            # compute distances between unique profiles, the matrix stays in memory until the group is complete
+            (unique_profiles, first, inverse, counts) = collapse_profiles(df.to_numpy())
+            unique_hashes = None
+            if profile_hashes is not None:
+                unique_hashes = [profile_hashes[i] for i in first]
+            (unique_matrix, cache_stats) = get_distance_matrix(unique_profiles, unique_hashes, distance_cache,
+                                                               tile_cells=tile_cells, scratch_dir=scratch_dir)
+            group_run_data.update(cache_stats)
+            group_run_data['count_unique_profiles'] = len(counts)
+
+        with timer.stage('clustering'):
+            # perform clustering on the matrix of all samples, linkage and the tree depend on duplicates
+            mc = matrix_clustering((labels, unique_matrix, inverse), thresholds, method, sort_matrix, tree_distances=tree_distance_representation)
+            memberships = mc.get_memberships()
+            if output_files is not None:
+                with open(output_files['tree'], 'w') as fh:
+                    fh.write(f"{mc.newick}\n")
+
+            # appends "{group_id}|" to the address
+            clust_df = pd.DataFrame({
+                id_col: list(memberships.keys()),
+                GAS_CLUSTER_ADDRESS_KEY: [f"{group_id}|{'.'.join(memberships[x])}" for x in memberships]
+            })
+            if output_files is not None:
+                clust_df.to_csv(output_files['clusters'],header=True,sep="\t",index=False)
+            # only the addresses are returned, they are merged with the metadata by the main process
+            addresses = (clust_df[id_col].tolist(), clust_df[GAS_CLUSTER_ADDRESS_KEY].tolist())
+            del(clust_df)
+
+        if sweep is not None:
+            with timer.stage('sweep'):
+                # every setting of the sweep reuses the distance matrix of the group, in the sample order of clusters.tsv
+                cs = clustering_sweep((labels, unique_matrix, inverse), [(x[1], x[2]) for x in sweep], sort_matrix)
+                sweep_addresses = {}
+                for (setting, setting_addresses) in zip(sweep, cs.get_addresses()):
+                    sweep_addresses[setting[0]] = (cs.labels, [f"{group_id}|{x}" for x in setting_addresses])
+
+        with timer.stage('statistics'):
+            stats = get_distance_stats(unique_matrix, counts, tile_cells)
+            min_dist = stats['min']
+            mean_dist = stats['mean']
+            med_dist = stats['median']
+            max_dist = stats['max']
+            if output_files is not None:
+                report(df, [id_col]).write_data(output_files['summary'])
+
+        with timer.stage('outliers'):
+            pairs = [] if keep_outputs else None
+            (outlier_ids, num_pairwise_outliers) = get_outliers(labels, unique_matrix, inverse, outlier_thresh,
+                                                                   output_files['outliers'] if output_files is not None else None,
+                                                                   block_cells=block_cells, pairs=pairs)
+            group_run_data['count_pairwise_outliers'] = num_pairwise_outliers
+            if keep_outputs:
+                outputs = {'tree': mc.newick, 'outliers': pd.DataFrame(pairs, columns=['id1', 'id2', 'dist'])}
+
+        with timer.stage('matrix'):
+            if output_files is not None and not skip_matrix:
+                write_matrix(labels, unique_matrix, inverse, output_files['matrix'], block_cells=block_cells)
+            if output_files is not None and write_condensed:
+                # rows in the same order as clusters.tsv
+                positions = {str(x): i for i, x in enumerate(labels)}
+                order = inverse[[positions[x] for x in mc.labels]]
+                np.save(output_files['condensed_matrix'], unique_matrix.expand(order).distances)
+            del(unique_matrix)
+
+    group_run_data['pid'] = timer.pid
+    group_run_data['stages'] = timer.get_stages()
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(output_files['profile'])
+
+    return { group_id:{
+        'count_members': len(labels),
+        'min_dist': min_dist,
+        'mean_dist': mean_dist,
+        'median_dist': med_dist,
+        'max_dist': max_dist,
+        'count_outliers': len(outlier_ids),
+        'outlier_ids':",".join([str(x) for x in outlier_ids]),
+        'addresses':addresses,
+        'sweep':sweep_addresses,
+        'outputs':outputs,
+        'run_data':group_run_data
+    }
+}
+
+def process_carried_group(group_id, labels, profiles, loci, output_files, previous_results, id_col, group_col, keep_outputs=False):
+    results = dict(previous_results)
+    results['addresses'] = ([], [])
+
+    # The loci summary records the run-wide allele codes, which can change without changing the fingerprint:
+    df = pd.DataFrame(profiles, index=labels, columns=loci)
+    report(df, [id_col]).write_data(output_files['summary'])
+
+    if os.path.isfile(output_files['clusters']):
+        clust_df = pd.read_csv(output_files['clusters'], sep="\t", header=0, dtype=str)
+        results['addresses'] = (clust_df[id_col].tolist(), clust_df[GAS_CLUSTER_ADDRESS_KEY].tolist())
+
+    # The outputs kept in memory by process_group are read back from the carried over files:
+    if keep_outputs and os.path.isfile(output_files['tree']) and os.path.isfile(output_files['outliers']):
+        with open(output_files['tree']) as fh:
+            tree = fh.read().strip()
+        outliers = pd.read_csv(output_files['outliers'], sep="\t", header=0, dtype={'id1': str, 'id2': str, 'dist': float})
+        results['outputs'] = {'tree': tree, 'outliers': outliers}
+
+    return { group_id: results }
+
+def get_linelist(group_metrics, metadata_df, metadata_groups, id_col):
+    '''
+    Merges the cluster addresses returned for each group with the metadata of the samples in the groups
+    :param group_metrics: dict of group id: dict of metrics, including the (sample ids, addresses) of the group
+    :param metadata_df: pd metadata
+    :param metadata_groups: pd.Series of the group id of each metadata row, NaN for rows in no group
+    :param id_col: str sample id column
+    :return: (pd of the metadata rows in group order, dict of group id: array of the positions of its rows)
+    '''
+    metadata_rows = metadata_groups.groupby(metadata_groups, sort=False).indices
+
+    rows = []
+    group_rows = {}
+    sample_addresses = {}
+    for group_id in group_metrics:
+        group_rows[group_id] = np.arange(len(rows), len(rows) + len(metadata_rows.get(group_id, [])))
+        rows.extend(metadata_rows.get(group_id, []))
+        (sample_ids, addresses) = group_metrics[group_id].get('addresses', ([], []))
+        sample_addresses.update(zip(sample_ids, addresses))
+
+    linelist_df = metadata_df.iloc[rows].reset_index(drop=True)
+    # Groups with too few members have no addresses, the column only exists if a group was clustered:
+    if len(sample_addresses) > 0:
+        linelist_df[GAS_CLUSTER_ADDRESS_KEY] = linelist_df[id_col].map(sample_addresses)
+    return (linelist_df, group_rows)
+
+def compile_group_data(group_metrics, metadata_df, metadata_groups, field_data_types, id_col, columns_to_skip=[], header=[]):
+    '''
+    Creates the cluster summary from the metadata of all groups and their metrics
+    :param group_metrics: dict of group id: dict of metrics
+    :param metadata_df: pd metadata
+    :param metadata_groups: pd.Series of the group id of each metadata row, NaN for rows in no group
+    :param field_data_types: dict of column: {data_type, default, ...}
+    :param id_col: str column of the group ids
+    :param columns_to_skip: list of metadata columns which are not summarized
+    :param header: list of summary columns to report
+    :return: pd indexed by group id, with every value as a string
+    '''
+    in_group = metadata_groups.notna().to_numpy()
+    s = summarizer(header, metadata_df[in_group], metadata_groups[in_group].to_numpy(), list(group_metrics.keys()),
+                   field_data_types, columns_to_skip=columns_to_skip)
+    data = s.get_data()
+    data[id_col] = list(data.index)
+
+    metrics = []
+    for id in group_metrics:
+        for k in group_metrics[id]:
+            if k == 'run_data' or k == 'addresses' or k == 'sweep' or k == 'outputs' or k in metrics:
+                continue
+            metrics.append(k)
+    for k in metrics:
+        data[k] = [str(group_metrics[id][k]) if k in group_metrics[id] else np.nan for id in data.index]
+    return data
+
+def get_cluster_counts(addresses, thresholds):
+    '''
+    Counts the clusters of each threshold level of a set of cluster addresses
+    :param addresses: list of addresses ({group id}|{cluster}.{cluster}...)
+    :param thresholds: list of thresholds, one per level of the addresses
+    :return: list of dicts, one per threshold
+    '''
+    levels = pd.Series(addresses, dtype=object).str.split('.', expand=True)
+    counts = []
+    for i, threshold in enumerate(thresholds):
+        sizes = np.zeros(0, dtype=int)
+        if len(addresses) > 0:
+            sizes = levels.groupby(list(levels.columns[:i + 1]), sort=False).size().to_numpy()
+        counts.append({
+            'threshold': threshold,
+            'count_clusters': len(sizes),
+            'count_singleton_clusters': int((sizes == 1).sum()),
+            'max_cluster_size': int(sizes.max()) if len(sizes) > 0 else 0,
+        })
+    return counts
+
+def get_sweep_tables(sweep, group_metrics, id_col, group_col):
+    '''
+    Creates the addresses of each setting of a sweep and a comparison of their cluster counts
+    :param sweep: list of (label, method, list of thresholds)
+    :param group_metrics: dict of group id: dict of metrics, including the sweep addresses of the clustered groups
+    :param id_col: str sample id column
+    :param group_col: str partition column
+    :return: (dict of setting label: pd of addresses, pd of cluster counts)
+    '''
+    tables = {}
+    rows = []
+    for (label, method, thresholds) in sweep:
+        sample_ids = []
+        group_ids = []
+        addresses = []
+        for group_id in group_metrics:
+            group_sweep = group_metrics[group_id].get('sweep')
+            if group_sweep is None:
+                continue
+            (ids, group_addresses) = group_sweep[label]
+            sample_ids.extend(ids)
+            group_ids.extend([group_id] * len(ids))
+            addresses.extend(group_addresses)
+
+        tables[label] = pd.DataFrame({id_col: sample_ids, group_col: group_ids, GAS_CLUSTER_ADDRESS_KEY: addresses})
+        for counts in get_cluster_counts(addresses, thresholds):
+            rows.append({'setting': label, 'method': method, 'thresholds': ",".join([str(x) for x in thresholds]), **counts})
+
+    counts_df = pd.DataFrame(rows, columns=['setting', 'method', 'thresholds', 'threshold', 'count_clusters',
+                                            'count_singleton_clusters', 'max_cluster_size'])
+    return (tables, counts_df)
+
+def write_sweep(outdir, tables, counts_df, writer):
+    '''
+    Writes the tables of a sweep created by get_sweep_tables
+    :param outdir: output directory of the run
+    :param tables: dict of setting label: pd of addresses
+    :param counts_df: pd of cluster counts
+    :param writer: output_writer
+    :return: dict of setting label: addresses file name
+    '''
+    sweep_dir = os.path.join(outdir, SWEEP_DIRECTORY)
+    if not os.path.isdir(sweep_dir):
+        os.makedirs(sweep_dir, 0o755)
+
+    files = {}
+    for label in tables:
+        files[label] = f"{label}.addresses.tsv"
+        writer.write_tsv(tables[label], os.path.join(sweep_dir, files[label]))
+    writer.write_tsv(counts_df, os.path.join(sweep_dir, SWEEP_COUNTS_FILEPATH_TSV))
+    return files
+
+def format_df(column_map,df):
+    df_cols = list(df.columns)
+    cols_to_remove = list(set(df_cols) - set(column_map.keys()))
+    df = df.drop(cols_to_remove, axis=1)
+    df = df[list(column_map.keys())]
+    return df.rename(columns=column_map)
+
+def prepare_column_map(column_info,columns):
+    column_map = {}
+    for f in column_info:
+        column_map[f] = column_info[f][LABEL_KEY]
+        if column_map[f] == "":
+            column_map[f] = f
+
+    for f in columns:
+        column_map[f] = f
+
+    return column_map
+
+def prepare_linelist(column_info,df,columns):
+    if len(columns) == 0:
+        columns = df.columns.to_list()
+    column_map = prepare_column_map(column_info,columns)
+    return format_df(column_map, df)
+
+
+def update_column_order(df,col_properties,restrict=False):
+    cols = {}
+    df_cols = list(df.columns)
+    num_rows = len(df)
+    for col in col_properties:
+        if DISPLAY_KEY in col_properties[col] and col_properties[col][DISPLAY_KEY]:
+            if LABEL_KEY in col_properties[col]:
+                cols[col] = col_properties[col][LABEL_KEY]
+            else:
+                cols[col] = str(col)
+            if col not in df_cols:
+                df[col] = [col_properties[col]['default']] * num_rows
+
+    order = list(cols.keys())
+    if not restrict:
+        to_add = set(df_cols ) - set(order)
+        for c in df_cols:
+            if c in to_add:
+                order.append(c)
+                cols[c] = c
+
+    df = df.reindex(columns=order)
+    df = df.rename(columns=cols)
+
+    return df[list(cols.values())]
+
+def encode_profiles(profile_file):
+    '''
+    Loads the allele profiles and encodes them once into a compact integer array, groups only refer to its rows
+    :param profile_file: path to the profiles, or a pandas DataFrame or pyarrow Table of the profiles
+    :return: dict of the allele_map, loci, sample_ids and profiles (2D numpy array, one row per sample)
+    '''
+    (allele_map, profile_df) = load_profiles(profile_file)
+    profiles = profile_df.to_numpy()
+    if profiles.size > 0 and profiles.dtype.kind in 'iu':
+        profiles = profiles.astype(np.min_scalar_type(profiles.max()))
+    return {
+        'allele_map': allele_map,
+        'loci': profile_df.columns.to_list(),
+        'sample_ids': [str(x) for x in profile_df.index.to_list()],
+        'profiles': profiles,
+    }
+
+def cluster_reporter(config, encoded_profiles=None, shard_manifest=None, shard_index=None, store=None, metadata_table=None,
+                     in_memory=False):
+    '''
+    Runs the analysis described by config
+    :param config: dict of parameters
+    :param encoded_profiles: dict of profiles already loaded by encode_profiles, None to load config[profile]
+    :param shard_manifest: shards with the manifest read, to process one shard or merge the results of all shards
+    :param shard_index: int index of the shard to process, None to merge the results of all shards
+    :param store: distance_store shared with the other partitionings of the run, used without a distance cache
+    :param metadata_table: pandas DataFrame or pyarrow Table of the metadata, None to read config[metadata]
+    :param in_memory: run for the Python API, config[outdir] may be None to write nothing and the results include
+                      the tree and pairwise outliers of each group
+    :return: dict of results (see arborator.api.run), None for a plan or a shard, or dict of partition column: results
+             with several partition columns
+    '''
+    validate_params(config, in_memory=in_memory)
+    params = check_parameters(config, in_memory=in_memory)
+    partition_cols = get_partition_columns(config[PARTITION_COLUMN_KEY])
+    if len(partition_cols) > 1:
+        return report_partitions(config, partition_cols, encoded_profiles=encoded_profiles, metadata_table=metadata_table,
+                                 in_memory=in_memory)
+
+    profile_file = config[PROFILE_KEY]
+    partition_file = config[METADATA_KEY]
+    outdir = config[OUTDIR_KEY]
+    outlier_thresh = params[OUTLIER_THRESHOLD_KEY]
+    thresholds = params[THRESHOLDS_KEY]
+    method = config[CLUSTER_METHOD_KEY]
+    tree_distance_representation = config[TREE_DISTANCES_KEY]
+    sort_matrix = config[SORT_MATRIX_KEY]
+    skip_matrix = config[SKIP_MATRIX_KEY]
+    write_condensed = config[CONDENSED_MATRIX_KEY]
+    id_col = config[ID_COLUMN_KEY]
+    partition_col = config[PARTITION_COLUMN_KEY]
+    min_members = params[MINIMUM_MEMBERS_KEY]
+    num_threads = params[THREADS_KEY]
+    max_memory = params[MAX_MEMORY_KEY]
+    tile_size = params[TILE_SIZE_KEY]
+    profile_run = config[PROFILE_RUN_KEY]
+    excel_mode = config[EXCEL_KEY]
+    plan_only = config[PLAN_KEY]
+    previous_outdir = config[INCREMENTAL_KEY]
+    cache_file = config[DISTANCE_CACHE_KEY]
+    cache_size = params[DISTANCE_CACHE_SIZE_KEY]
+    restrict_output = config[ONLY_REPORT_LABELED_KEY]
+    num_shards = params[NUM_SHARDS_KEY]
+    sweep = params[SWEEP_KEY]
+
+    # arborator plan writes a shard manifest, run-shard processes the groups of one shard and merge writes the run outputs:
+    merging = shard_manifest is not None and shard_index is None
+    write_outputs = not plan_only and num_shards is None and shard_index is None and outdir is not None
+
+    run_data = {}
+    run_data['analysis_start_time'] = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+    run_data['parameters'] = config
+
+    linelist_cols_properties = {}
+    line_list_columns = []
+    if LINELIST_COLUMNS_KEY in config:
+        linelist_cols_properties = config[LINELIST_COLUMNS_KEY]
+        for f in linelist_cols_properties:
+            if DISPLAY_KEY in linelist_cols_properties[f]:
+                if linelist_cols_properties[f][DISPLAY_KEY]:
+                    line_list_columns.append(f)
+
+    cluster_summary_cols_properties = {}
+    cluster_summary_header = []
+    cluster_display_cols_to_remove = []
+    if GROUPED_METADATA_COLUMNS_KEY in config:
+        cluster_summary_cols_properties = config[GROUPED_METADATA_COLUMNS_KEY]
+        cluster_summary_header = list(cluster_summary_cols_properties.keys())
+        for f in cluster_summary_cols_properties:
+            cluster_summary_cols_properties[f]['data_type'] = cluster_summary_cols_properties[f]['data_type'].lower()
+            if DISPLAY_KEY in cluster_summary_cols_properties[f]:
+                if not cluster_summary_cols_properties[f][DISPLAY_KEY]:
+                    cluster_display_cols_to_remove.append(f)
+    else:
+        cluster_summary_cols_properties[partition_col] = { "data_type": "none","label":partition_col,"default":"","display":"True"}
+        cluster_summary_cols_properties['min_dist'] = { "data_type": "none","label":'min_dist',"default":"","display":"True"}
+        cluster_summary_cols_properties['median_dist'] = { "data_type": "none","label":'median_dist',"default":"","display":"True"}
+        cluster_summary_cols_properties['mean_dist'] = { "data_type": "none","label":'mean_dist',"default":"","display":"True"}
+        cluster_summary_cols_properties['max_dist'] = { "data_type": "none","label":'max_dist',"default":"","display":"True"}
+        cluster_summary_cols_properties['count_outliers'] = { "data_type": "none","label":'count_outliers',"default":"","display":"True"}
+        cluster_summary_cols_properties['outlier_ids'] = { "data_type": "none","label":'outlier_ids',"default":"","display":"True"}
+        cluster_summary_header = list(cluster_summary_cols_properties.keys())
+
+    if len(cluster_summary_header) == 0:
+        cluster_summary_header = [partition_col]
+
+    # initialize analysis directory
+    if not plan_only and outdir is not None and not os.path.isdir(outdir):
+        os.makedirs(outdir, 0o755)
+
+    profiler = None
+    if profile_run:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    timer = stage_timer()
+    writer = output_writer(excel_mode)
+
+    timer.start('load')
+    if encoded_profiles is None:
+        encoded_profiles = encode_profiles(profile_file)
+    allele_map = encoded_profiles['allele_map']
+    loci = encoded_profiles['loci']
+    profiles = encoded_profiles['profiles']
+    sample_ids = encoded_profiles['sample_ids']
+    profile_df = pd.DataFrame({id_col: sample_ids})
+
+    #write allele mapping file
+    if write_outputs:
+        with open(os.path.join(outdir,"allele_map.json"),'w' ) as fh:
+            fh.write(json.dumps(allele_map, indent=4))
+
+    # Every column is read, the overlap and group metadata files keep all of them even if the output is restricted:
+    metadata = read_data(partition_file if metadata_table is None else metadata_table)
+    metadata_df = metadata.df
+
+    if len(metadata_df) == 0:
+        message = 'No metadata rows were provided.'
+        raise Exception(message)
+
+    timer.end()
+
+    timer.start('split')
+    input_profile_samples = set(profile_df[id_col])
+    input_metadata_samples = set(metadata_df[id_col])
+
+    ovl_samples = input_profile_samples & input_metadata_samples
+    missing_profile_samples = input_profile_samples - ovl_samples
+    missing_metadata_samples = input_metadata_samples - ovl_samples
+
+    run_data['count_missing_profile_samples'] = len(missing_profile_samples)
+    run_data['missing_profile_samples'] = ",".join(sorted(list(missing_profile_samples)))
+    run_data['count_missing_metadata_samples'] = len(missing_metadata_samples)
+    run_data['missing_metadata_samples'] = ",".join(sorted(list(missing_metadata_samples)))
+    ovl_samples = list(ovl_samples)
+
+    overlap_df = metadata_df[metadata_df[id_col].isin(ovl_samples)]
+    if write_outputs:
+        overlap_df.to_csv(os.path.join(outdir,"metadata.overlap.tsv"),sep="\t",header=True,index=False)
+    split = split_profiles(profile_df[profile_df[id_col].isin(ovl_samples)],overlap_df,id_col,partition_col)
+    del(overlap_df)
+    groups = split.subsets
+    group_file_mapping = split.group_file_mapping
+
+    group_rows = {}
+    for group_id in groups:
+        group_rows[group_id] = groups[group_id].index.to_numpy()
+
+    timer.end()
+
+    # Only groups with at least min_members are staged and clustered, the summary rows of the others are filled directly:
+    timer.start('planning')
+    (clustered_groups, skipped_groups) = plan_groups(group_rows, min_members)
+    if shard_manifest is not None:
+        shard_manifest.check_groups(group_rows, clustered_groups, group_file_mapping)
+        if shard_index is not None:
+            shard_group_ids = set(shard_manifest.get_group_ids(shard_index))
+            clustered_groups = [x for x in clustered_groups if x in shard_group_ids]
+    timer.end()
+    if plan_only or num_shards is not None:
+        print_plan(group_rows, clustered_groups, group_file_mapping, len(loci), min_members, max_memory=max_memory, tile_size=tile_size)
+        if num_shards is not None:
+            plan_shards(config, group_rows, clustered_groups, group_file_mapping, len(loci), num_shards, min_members,
+                        tile_size=tile_size, dry_run=plan_only)
+        return
+    run_data['count_skipped_groups'] = len(skipped_groups)
+
+    timer.start('split')
+
+    filtered_samples = pd.concat(list(groups.values()), ignore_index=True)[id_col].to_list()
+    linelist_df = prepare_linelist({}, metadata_df[metadata_df[id_col].isin(filtered_samples)], columns=[])
+    ll_cols = list(set(linelist_df.columns.to_list()))
+    if restrict_output:
+        t = []
+        for c in line_list_columns:
+            if c in ll_cols:
+                t.append(c)
+        line_list_columns = t
+    else:
+        t = []
+        for c in line_list_columns:
+            if c in ll_cols:
+                t.append(c)
+        for c in ll_cols:
+            if not c in t:
+                t.append(c)
+        line_list_columns = t
+
+    linelist_df = prepare_linelist({}, metadata_df[metadata_df[id_col].isin(list(set(metadata_df[id_col].to_list()) - set(filtered_samples)))], columns=[])
+    linelist_df = linelist_df[line_list_columns]
+    run_data['threshold_map'] = format_threshold_map(thresholds)
+    if write_outputs:
+        writer.write_tsv(linelist_df, os.path.join(outdir, "metadata.excluded.tsv"))
+        with open(os.path.join(outdir,"threshold_map.json"),'w' ) as fh:
+            fh.write(json.dumps(run_data['threshold_map'], indent=4))
+    del(linelist_df)
+
+    timer.end()
+
+    timer.start('staging')
+    # Results of groups that are unchanged since the previous run are carried over:
+    fingerprint_parameters = {
+        ID_COLUMN_KEY: id_col,
+        THRESHOLDS_KEY: thresholds,
+        CLUSTER_METHOD_KEY: method,
+        TREE_DISTANCES_KEY: tree_distance_representation,
+        SORT_MATRIX_KEY: sort_matrix,
+        SKIP_MATRIX_KEY: skip_matrix,
+        CONDENSED_MATRIX_KEY: write_condensed,
+        OUTLIER_THRESHOLD_KEY: outlier_thresh,
+        MINIMUM_MEMBERS_KEY: min_members,
+    }
+    if sweep is not None and previous_outdir is not None:
+        # The addresses of the sweep are not kept between runs, so every group is clustered again:
+        print(f'WARNING: {INCREMENTAL_KEY} is not used with a sweep, all groups will be recomputed.')
+        previous_outdir = None
+    fingerprints = incremental(fingerprint_parameters, previous_outdir=previous_outdir)
+    for message in fingerprints.messages:
+        print(message)
+
+    group_fingerprints = {}
+    carried_over = {}
+    # Without an output directory there is no manifest for a later run:
+    if not merging and outdir is not None:
+        for group_id in clustered_groups:
+            rows = group_rows[group_id]
+            group_fingerprints[group_id] = fingerprints.fingerprint(group_id, [sample_ids[i] for i in rows], profiles[rows])
+            record = fingerprints.get_previous(group_id, group_fingerprints[group_id])
+            if record is not None:
+                carried_over[group_id] = record
+
+    metadata_groups = get_metadata_groups(groups, metadata_df, id_col)
+    compute_files = {}
+    carried_metrics = {}
+    if merging:
+        # The group directories were written by the shards, only their metadata.tsv is replaced:
+        group_files = stage_data(clustered_groups, outdir, group_file_mapping, carried_over=clustered_groups)
+    elif outdir is None:
+        # Nothing is written, the groups have no files:
+        group_files = {group_id: None for group_id in clustered_groups}
+        compute_files = dict(group_files)
+    else:
+        group_files = stage_data(clustered_groups, outdir, group_file_mapping, carried_over=list(carried_over.keys()))
+        for group_id in group_files:
+            if group_id in carried_over:
+                fingerprints.carry_over(carried_over[group_id], group_files[group_id])
+                rows = group_rows[group_id]
+                r = process_carried_group(group_id, [sample_ids[i] for i in rows], profiles[rows], loci, group_files[group_id],
+                                          carried_over[group_id]['results'], id_col, partition_col, keep_outputs=in_memory)
+                carried_metrics[group_id] = r[group_id]
+            else:
+                compute_files[group_id] = group_files[group_id]
+
+    cache = None
+    profile_hashes = None
+    if cache_file is not None:
+        cache = distance_cache(cache_file, max_entries=cache_size)
+        if not merging:
+            # The hashes are kept with the encoded profiles, for the other partitionings of the run:
+            if 'profile_hashes' not in encoded_profiles:
+                encoded_profiles['profile_hashes'] = cache.hash_profiles(profiles, loci, allele_map)
+            profile_hashes = encoded_profiles['profile_hashes']
+    if cache is not None or merging:
+        # The distance cache already shares distances with the other partitionings:
+        store = None
+    elif store is not None:
+        profile_hashes = store.row_ids
+
+    timer.end()
+
+    # Worker processes are forked during this stage, so the main process is not sampled:
+    timer.start('groups', sample=False)
+    computed_metrics = {}
+    if merging:
+        (shard_records, run_data['shards']) = shard_manifest.read_results()
+        for group_id in clustered_groups:
+            record = shard_records[group_id]
+            group_fingerprints[group_id] = record['fingerprint']
+            if record['carried_over']:
+                carried_metrics[group_id] = record['results']
+            else:
+                computed_metrics[group_id] = record['results']
+    else:
+        results = process_data(compute_files, group_rows, profiles, sample_ids, loci, id_col, partition_col, thresholds, outlier_thresh,
+                               method, min_members, tree_distance_representation, sort_matrix, skip_matrix=skip_matrix, write_condensed=write_condensed, tile_size=tile_size,
+                               profile_run=profile_run, num_cpus=num_threads, max_memory=max_memory, profile_hashes=profile_hashes, cache_file=cache_file,
+                               store=store, sweep=sweep, keep_outputs=in_memory)
+        for r in results:
+            for k in r:
+                computed_metrics[k] = r[k]
+    timer.end()
+
+    # A shard only writes its group directories and the results of its groups, which are merged by arborator merge:
+    if shard_index is not None:
+        shard_records = {}
+        for group_id in clustered_groups:
+            shard_records[group_id] = {
+                'fingerprint': group_fingerprints[group_id],
+                'carried_over': group_id in carried_metrics,
+                'results': carried_metrics[group_id] if group_id in carried_metrics else computed_metrics[group_id],
+            }
+        if cache is not None:
+            cache.close()
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(shard_manifest.directory, f"shard_{shard_index}.pstats"))
+        shard_manifest.write_results(shard_index, shard_records, {
+            'analysis_start_time': run_data['analysis_start_time'],
+            'analysis_end_time': datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+            'stages': timer.get_stages(),
+        })
+        return
+
+    timer.start('summary')
+
+    group_metrics = {}
+    group_records = {}
+    for group_id in groups:
+        if group_id in skipped_groups:
+            group_metrics[group_id] = get_skipped_group_metrics(len(group_rows[group_id]))
+            continue
+        if group_id in carried_metrics:
+            group_metrics[group_id] = carried_metrics[group_id]
+        else:
+            group_metrics[group_id] = computed_metrics[group_id]
+        if write_outputs:
+            group_records[group_id] = fingerprints.create_record(group_fingerprints[group_id], group_file_mapping[group_id],
+                                                                group_files[group_id], group_metrics[group_id], min_members)
+    if write_outputs:
+        fingerprints.write_manifest(outdir, group_records)
+    run_data['count_recomputed_groups'] = len(computed_metrics)
+    run_data['count_carried_over_groups'] = len(carried_metrics)
+
+    hits = 0
+    misses = 0
+    for group_id in computed_metrics:
+        hits += computed_metrics[group_id]['run_data'].get('distance_cache_hits', 0)
+        misses += computed_metrics[group_id]['run_data'].get('distance_cache_misses', 0)
+    if store is not None:
+        run_data['distance_store'] = {'hits': hits, 'misses': misses}
+    if cache is not None:
+        run_data['distance_cache'] = {
+            'path': cache_file,
+            'hits': hits,
+            'misses': misses,
+            'evicted': cache.evict(),
+            'num_entries': cache.get_num_entries(),
+        }
+        cache.close()
+
+    #merge metadata files
+
+    summary_df = compile_group_data(group_metrics, metadata_df, metadata_groups, cluster_summary_cols_properties, partition_col,
+                                    columns_to_skip=[id_col, partition_col], header=cluster_summary_header)
+    cluster_display_cols_to_remove = list(set(cluster_display_cols_to_remove) & set(list(summary_df.columns)))
+    summary_df = summary_df.drop(cluster_display_cols_to_remove, axis=1)
+    summary_cols = sorted(list(summary_df.columns))
+    display_columns = []
+    for col in cluster_summary_cols_properties:
+        prop = cluster_summary_cols_properties[col]
+        if DISPLAY_KEY in prop:
+            if prop[DISPLAY_KEY]:
+                display_columns.append(col)
+        else:
+            display_columns.append(col)
+    for col in summary_cols:
+        if col in display_columns:
+            continue
+        display_columns.append(col)
+
+    summary_df = summary_df[display_columns]
+    for k in cluster_display_cols_to_remove:
+        del(cluster_summary_cols_properties[k])
+    summary_df = update_column_order(summary_df, cluster_summary_cols_properties, restrict=restrict_output)
+    if write_outputs:
+        writer.write_tsv(summary_df, os.path.join(outdir, CLUSTER_SUMMARY_FILEPATH_TSV))
+    timer.end()
+
+    if write_outputs:
+        with timer.stage('excel'):
+            writer.write_excel(summary_df, os.path.join(outdir, CLUSTER_SUMMARY_FILEPATH_EXCEL), CLUSTER_SUMMARY_SHEET_NAME)
+
+    sweep_tables = None
+    if sweep is not None:
+        with timer.stage('sweep'):
+            sweep_tables = get_sweep_tables(sweep, group_metrics, id_col, partition_col)
+            if write_outputs:
+                run_data['sweep'] = write_sweep(outdir, sweep_tables[0], sweep_tables[1], writer)
+
+    timer.start('linelist')
+    if LINELIST_COLUMNS_KEY in config:
+        line_list_columns = []
+        linelist_cols_properties = config[LINELIST_COLUMNS_KEY]
+        for f in linelist_cols_properties:
+            if DISPLAY_KEY in linelist_cols_properties[f]:
+                if linelist_cols_properties[f][DISPLAY_KEY]:
+                    line_list_columns.append(f)
+
+    if not restrict_output and GAS_CLUSTER_ADDRESS_KEY not in line_list_columns:
+        line_list_columns.append(GAS_CLUSTER_ADDRESS_KEY)
+
+    (linelist_df, linelist_rows) = get_linelist(group_metrics, metadata_df, metadata_groups, id_col)
+    if write_outputs:
+        for group_id in group_files:
+            if len(linelist_rows[group_id]) < min_members:
+                directory_name = group_file_mapping[group_id]
+                shutil.rmtree(os.path.join(outdir, directory_name))
+                continue
+            linelist_df.iloc[linelist_rows[group_id]].to_csv(group_files[group_id][METADATA_KEY], sep="\t", header=True, index=False)
+
+    # Only try to load metadata columns that actually exists:
+    intersection = set(line_list_columns).intersection(set(linelist_df.columns))
+
+    # Ensure clustering was successful and therefore the GAS_CLUSTER_ADDRESS_KEY
+    # column exists in both the line list and dataframe:
+    if GAS_CLUSTER_ADDRESS_KEY in intersection:
+
+        # Warn about metadata columns specified in the line list that don't exist
+        # in the metadata. This warning is inside the conditional, otherwise
+        # it will report that GAS_CLUSTER_ADDRESS_KEY was specified in the
+        # line list, but doesn't exist, which isn't true. It's how arborator handles
+        # this data.
+        difference = set(line_list_columns).difference(set(linelist_df.columns))
+
+        for item in difference:
+            print(f'WARNING: "{item}" specified in the line list, but does not exist in the metadata.')
+
+        linelist_df = linelist_df[list(intersection)]
+        linelist_df = update_column_order(linelist_df, linelist_cols_properties, restrict=restrict_output)
+
+        if write_outputs:
+            writer.write_tsv(linelist_df, os.path.join(outdir, METADATA_INCLUDED_FILEPATH_TSV))
+        timer.end()
+
+        if write_outputs:
+            with timer.stage('excel'):
+                writer.write_excel(linelist_df, os.path.join(outdir, METADATA_INCLUDED_FILEPATH_EXCEL), METADATA_INCLUDED_SHEET_NAME)
+
+    else:
+        linelist_df = None
+        timer.end()
+        print(f'WARNING: Failed to generate any clusters! No "{METADATA_INCLUDED_FILEPATH_TSV}" will be generated.')
+
+    # Workbooks written in the background are finished before the run is complete:
+    with timer.stage('excel'):
+        writer.wait()
+    run_data['outputs'] = writer.get_times()
+
+    # Stages of the main process, totals of the stages of the groups and the stages of each group:
+    run_data['stages'] = timer.get_stages()
+    group_stages = []
+    run_data['groups'] = {}
+    for group_id in computed_metrics:
+        group_stages.append(computed_metrics[group_id]['run_data']['stages'])
+        run_data['groups'][str(group_id)] = computed_metrics[group_id]['run_data']
+    run_data['group_stages'] = stage_timer.combine(group_stages)
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(outdir, PROFILE_STATS_FILE))
+
+    run_data['analysis_end_time'] = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+    sys.stdout.flush()
+
+    if write_outputs:
+        with open(os.path.join(outdir, "run.json"), 'w') as fh:
+            fh.write(json.dumps(run_data, indent=4))
+
+    return get_results(group_metrics, summary_df, linelist_df, sweep_tables, run_data, id_col, partition_col)
+
+def get_results(group_metrics, summary_df, linelist_df, sweep_tables, run_data, id_col, group_col):
+    '''
+    Collects the results of a run
+    :param group_metrics: dict of group id: dict of metrics
+    :param summary_df: pd cluster summary
+    :param linelist_df: pd line list of the clustered samples, None if no group was clustered
+    :param sweep_tables: (dict of setting label: pd of addresses, pd of cluster counts), None without a sweep
+    :param run_data: dict of the run information
+    :param id_col: str sample id column
+    :param group_col: str partition column
+    :return: dict of results
+    '''
+    stats = []
+    addresses = {}
+    outliers = {}
+    trees = {}
+    for group_id in group_metrics:
+        metrics = group_metrics[group_id]
+        row = {group_col: group_id}
+        for k in metrics:
+            if k == 'run_data' or k == 'addresses' or k == 'sweep' or k == 'outputs':
+                continue
+            row[k] = metrics[k]
+        stats.append(row)
+
+        (sample_ids, group_addresses) = metrics.get('addresses', ([], []))
+        if len(sample_ids) > 0:
+            addresses[group_id] = pd.DataFrame({id_col: sample_ids, GAS_CLUSTER_ADDRESS_KEY: group_addresses})
+        if metrics.get('outputs') is not None:
+            outliers[group_id] = metrics['outputs']['outliers']
+            trees[group_id] = metrics['outputs']['tree']
+
+    results = {
+        'cluster_summary': summary_df,
+        'linelist': linelist_df,
+        'addresses': addresses,
+        'stats': pd.DataFrame(stats).set_index(group_col) if len(stats) > 0 else pd.DataFrame(),
+        'outliers': outliers,
+        'trees': trees,
+        'sweep': None,
+        'run_data': run_data,
+    }
+    if sweep_tables is not None:
+        results['sweep'] = {'addresses': sweep_tables[0], 'cluster_counts': sweep_tables[1]}
+    return results
+
+def process_shard(outdir, shard_index, num_threads=None, max_memory=None):
+    '''
+    Processes the groups of one shard of an analysis planned by arborator plan
+    :param outdir: output directory given to arborator plan
+    :param shard_index: int index of the shard
+    :param num_threads: int CPU threads, None for the planned value
+    :param max_memory: memory budget in GB, None for the planned value
+    :return: None
+    '''
+    shard_manifest = shards(outdir)
+    shard_manifest.read_manifest()
+    shard_manifest.get_group_ids(shard_index)
+    config = shard_manifest.get_parameters()
+    # The output directory was created by arborator plan:
+    config[FORCE_KEY] = True
+    if num_threads is not None:
+        config[THREADS_KEY] = num_threads
+    if max_memory is not None:
+        config[MAX_MEMORY_KEY] = max_memory
+    cluster_reporter(config, shard_manifest=shard_manifest, shard_index=shard_index)
+
+def merge_shards(outdir):
+    '''
+    Writes the outputs of an analysis planned by arborator plan from the results of its shards
+    :param outdir: output directory given to arborator plan
+    :return: None
+    '''
+    shard_manifest = shards(outdir)
+    shard_manifest.read_manifest()
+    # Every shard needs to have finished before any output is written:
+    shard_manifest.read_results()
+    config = shard_manifest.get_parameters()
+    config[FORCE_KEY] = True
+    cluster_reporter(config, shard_manifest=shard_manifest)
+
+def get_partition_directories(partition_cols):
+    '''
+    Creates a file path-safe directory name for each partition column
+    :param partition_cols: list of partition columns
+    :return: dict of partition column: directory name
+    '''
+    directories = {}
+    used = set()
+    for col in partition_cols:
+        directory = re.sub(r"[^A-Za-z0-9_\-.]", "_", col)
+        while directory in used:
+            directory += "-1"
+        used.add(directory)
+        directories[col] = directory
+    return directories
+
+def report_partitions(config, partition_cols, encoded_profiles=None, metadata_table=None, in_memory=False):
+    '''
+    Runs the analysis for each partition column in its own subdirectory of the output directory. The profiles are
+    encoded once and, without a distance cache, the distance matrices of the groups are kept in a distance store for
+    the run, so pairs of samples grouped together by several partition columns are only compared once
+    :param config: dict of parameters
+    :param partition_cols: list of partition columns
+    :param encoded_profiles: dict of profiles already loaded by encode_profiles, None to load config[profile]
+    :param metadata_table: pandas DataFrame or pyarrow Table of the metadata, None to read config[metadata]
+    :param in_memory: run for the Python API, see cluster_reporter
+    :return: dict of partition column: results of cluster_reporter, None for a plan
+    '''
+    outdir = config[OUTDIR_KEY]
+    plan_only = config[PLAN_KEY]
+    previous_outdir = config[INCREMENTAL_KEY]
+    directories = get_partition_directories(partition_cols)
+
+    run_data = {}
+    run_data['analysis_start_time'] = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+    if not plan_only and outdir is not None and not os.path.isdir(outdir):
+        os.makedirs(outdir, 0o755)
+
+    if encoded_profiles is None:
+        encoded_profiles = encode_profiles(config[PROFILE_KEY])
+
+    store = None
+    if config[DISTANCE_CACHE_KEY] is None and not plan_only:
+        # Without an output directory, the store is kept in the temporary directory:
+        store = distance_store(tempfile.mkdtemp(prefix="distance_store_", dir=outdir), encoded_profiles['profiles'])
+
+    results = {}
+    run_data['partitions'] = {}
+    try:
+        for i, col in enumerate(partition_cols):
+            print(f'{PARTITION_COLUMN_KEY} {col}: {directories[col]}')
+            partition_config = copy.deepcopy(config)
+            partition_config[PARTITION_COLUMN_KEY] = col
+            if outdir is not None:
+                partition_config[OUTDIR_KEY] = os.path.join(outdir, directories[col])
+            if previous_outdir is not None:
+                partition_config[INCREMENTAL_KEY] = os.path.join(previous_outdir, directories[col])
+            if store is not None:
+                # The matrices of the last partitioning are not needed by any other:
+                store.start_partition(keep=i < len(partition_cols) - 1)
+            results[col] = cluster_reporter(partition_config, encoded_profiles=encoded_profiles, store=store,
+                                            metadata_table=metadata_table, in_memory=in_memory)
+            if store is not None:
+                store.end_partition()
+            if plan_only:
+                continue
+
+            partition_run_data = results[col]['run_data']
+            run_data['partitions'][col] = {'directory': directories[col]}
+            if 'distance_store' in partition_run_data:
+                run_data['partitions'][col]['distance_store_hits'] = partition_run_data['distance_store']['hits']
+                run_data['partitions'][col]['distance_store_misses'] = partition_run_data['distance_store']['misses']
+    finally:
+        if store is not None:
+            shutil.rmtree(store.directory)
+
+    if plan_only:
+        return None
+
+    run_data['analysis_end_time'] = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+    if outdir is not None:
+        with open(os.path.join(outdir, "run.json"), 'w') as fh:
+            fh.write(json.dumps(run_data, indent=4))
+    return results
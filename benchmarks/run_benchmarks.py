@@ -0,0 +1,189 @@
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import (ArgumentParser, ArgumentDefaultsHelpFormatter)
+import numpy as np
+import pandas as pd
+from arborator.version import __version__
+from arborator.parameters import process_thresholds
+from arborator.utils import load_profiles, get_metadata_groups, stage_data, process_group
+from arborator.classes.split_profiles import split_profiles
+from arborator.classes.aggregator import summarizer
+from arborator.classes.report import report
+from arborator.classes.read_data import read_data
+from arborator.classes.stage_timer import stage_timer
+from synthetic_data import generate_dataset, add_dataset_arguments, get_dataset_parameters
+
+def time_component(name, function, count_items, repeats):
+    '''
+    Times a component, the fastest of the repeats is reported
+    :param name: str name of the component
+    :param function: callable run by each repeat
+    :param count_items: int number of items (samples or pairs) processed by a repeat
+    :param repeats: int number of repeats
+    :return: dict
+    '''
+    wall_times = []
+    record = None
+    for i in range(repeats):
+        timer = stage_timer()
+        with timer.stage(name):
+            function()
+        stage = timer.get_stages()[name]
+        wall_times.append(stage['wall_time_s'])
+        if record is None or stage['wall_time_s'] < record['wall_time_s']:
+            record = dict(stage)
+
+    record['wall_times_s'] = wall_times
+    record['count_items'] = count_items
+    record['items_per_s'] = round(count_items / record['wall_time_s'], 3) if record['wall_time_s'] > 0 else None
+    return record
+
+def benchmark_components(dataset, config, workdir, repeats):
+    '''
+    Times the main components of arborator on their own, in this process
+    :return: dict of component: timings
+    '''
+    files = dataset['files']
+    id_col = config['id_col']
+    partition_col = config['partition_col']
+    thresholds = process_thresholds(config['thresholds'].split(','))
+    field_data_types = {}
+    for col in config['grouped_metadata_columns']:
+        field_data_types[col] = dict(config['grouped_metadata_columns'][col])
+        field_data_types[col]['data_type'] = field_data_types[col]['data_type'].lower()
+
+    results = {}
+    loaded = {}
+
+    def load():
+        loaded['profiles'] = load_profiles(files['profile'])
+        loaded['metadata'] = read_data(files['metadata']).df
+    results['load'] = time_component('load', load, dataset['num_samples'], repeats)
+
+    (allele_map, profile_df) = loaded['profiles']
+    metadata_df = loaded['metadata']
+    loci = profile_df.columns.to_list()
+    profiles = profile_df.to_numpy()
+    sample_ids = [str(x) for x in profile_df.index.to_list()]
+    ids_df = pd.DataFrame({id_col: sample_ids})
+
+    split = {}
+    def split_groups():
+        split['groups'] = split_profiles(ids_df, metadata_df, id_col, partition_col).subsets
+    results['split_profiles'] = time_component('split_profiles', split_groups, dataset['num_samples'], repeats)
+    groups = split['groups']
+
+    metadata_groups = get_metadata_groups(groups, metadata_df, id_col)
+    in_group = metadata_groups.notna().to_numpy()
+    header = list(field_data_types.keys())
+    def summarize():
+        summarizer(header, metadata_df[in_group], metadata_groups[in_group].to_numpy(), list(groups.keys()),
+                   field_data_types, columns_to_skip=[id_col, partition_col]).get_data()
+    results['summarizer'] = time_component('summarizer', summarize, int(in_group.sum()), repeats)
+
+    # The largest group dominates the run time:
+    group_id = max(groups, key=lambda x: len(groups[x]))
+    rows = groups[group_id].index.to_numpy()
+    labels = [sample_ids[i] for i in rows]
+    group_profiles = profiles[rows]
+    num_members = len(labels)
+
+    group_df = pd.DataFrame(group_profiles, index=labels, columns=loci)
+    def report_loci():
+        report(group_df, [id_col])
+    results['report'] = time_component('report', report_loci, num_members, repeats)
+
+    output_files = stage_data([group_id], workdir, {group_id: 'largest_group'})[group_id]
+    def process():
+        process_group(group_id, labels, group_profiles, loci, output_files, id_col, partition_col, thresholds,
+                      float(config['outlier_thresh']), config['method'], 'patristic', False,
+                      min_members=config['min_members'])
+    results['process_group'] = time_component('process_group', process, num_members * (num_members - 1) // 2, repeats)
+    results['process_group']['count_members'] = num_members
+
+    return results
+
+def benchmark_run(dataset, outdir, repeats, num_threads=1):
+    '''
+    Times complete runs of arborator in a separate process, the stages are read from run.json
+    :return: dict
+    '''
+    files = dataset['files']
+    wall_times = []
+    record = None
+    for i in range(repeats):
+        command = [sys.executable, '-m', 'arborator.main', '--profile', files['profile'], '--metadata', files['metadata'],
+                   '--config', files['config'], '--outdir', outdir, '--force', '--n_threads', str(num_threads)]
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        wall_time = round(time.perf_counter() - start, 6)
+        wall_times.append(wall_time)
+        if record is None or wall_time < record['wall_time_s']:
+            with open(os.path.join(outdir, "run.json")) as fh:
+                run_data = json.loads(fh.read())
+            record = {
+                'wall_time_s': wall_time,
+                'stages': run_data['stages'],
+                'group_stages': run_data['group_stages'],
+                'outputs': run_data['outputs'],
+            }
+
+    record['wall_times_s'] = wall_times
+    record['samples_per_s'] = round(dataset['num_samples'] / record['wall_time_s'], 3)
+    # Largest resident memory of any finished child process, the run or one of its workers (kilobytes on Linux):
+    record['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 3)
+    return record
+
+def get_environment():
+    return {
+        'arborator': __version__,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def main():
+    parser = ArgumentParser(description="Times arborator and its components on a synthetic cgMLST dataset",
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--outdir', type=str, required=False,
+                        help='Working directory for the dataset and the runs (default: a temporary directory)')
+    parser.add_argument('--output', type=str, required=False, help='JSON file of the results (default: printed)')
+    parser.add_argument('--repeats', type=int, default=1, help='Number of times each benchmark is run, the fastest is reported')
+    parser.add_argument('--n_threads', type=int, default=1, help='CPU threads of the complete runs')
+    parser.add_argument('--skip_run', action='store_true', help='Only time the components, not complete runs')
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        outdir = args.outdir if args.outdir is not None else tmpdir
+        dataset = generate_dataset(os.path.join(outdir, "dataset"), **get_dataset_parameters(args))
+        with open(dataset['files']['config']) as fh:
+            config = json.loads(fh.read())
+
+        results = {
+            'environment': get_environment(),
+            'dataset': dataset,
+            'components': benchmark_components(dataset, config, os.path.join(outdir, "components"), args.repeats),
+        }
+        if not args.skip_run:
+            results['cluster_reporter'] = benchmark_run(dataset, os.path.join(outdir, "run"), args.repeats, num_threads=args.n_threads)
+
+    del(results['dataset']['files'])
+    output = json.dumps(results, indent=4)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as fh:
+            fh.write(output)
+
+# call main function
+if __name__ == '__main__':
+    main()
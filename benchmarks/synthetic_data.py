@@ -0,0 +1,211 @@
+import json
+import os
+from argparse import (ArgumentParser, ArgumentDefaultsHelpFormatter)
+import numpy as np
+import pandas as pd
+
+GROUP_SIZE_DISTRIBUTIONS = ['uniform', 'zipf', 'lognormal']
+
+ID_COLUMN = "sample_id"
+PARTITION_COLUMN = "cluster_id"
+
+COUNTRIES = ['Canada', 'United States', 'Mexico', 'United Kingdom', 'France', 'Australia']
+HOSTS = ['human', 'chicken', 'cattle', 'pork']
+
+# Alleles of the group founders are drawn from 1..FOUNDER_ALLELES, mutations introduce alleles above it
+FOUNDER_ALLELES = 500
+MAX_ALLELE = 5000
+
+def get_group_sizes(num_samples, num_groups, distribution, rng):
+    '''
+    Splits the samples into groups, every group has at least one member
+    :param num_samples: int number of samples
+    :param num_groups: int number of groups
+    :param distribution: str shape of the group sizes, one of GROUP_SIZE_DISTRIBUTIONS
+    :param rng: numpy Generator
+    :return: numpy array of group sizes, largest first
+    '''
+    if num_groups < 1 or num_groups > num_samples:
+        message = f'Number of groups ({num_groups}) needs to be between 1 and the number of samples ({num_samples})'
+        raise Exception(message)
+
+    if distribution == 'uniform':
+        weights = np.ones(num_groups)
+    elif distribution == 'zipf':
+        # A few large outbreaks and a long tail of small groups:
+        weights = 1 / np.arange(1, num_groups + 1)
+    elif distribution == 'lognormal':
+        weights = rng.lognormal(mean=0, sigma=1, size=num_groups)
+    else:
+        message = f'Group size distribution supplied is invalid: {distribution}, it needs to be one of {", ".join(GROUP_SIZE_DISTRIBUTIONS)}'
+        raise Exception(message)
+
+    weights = np.sort(weights)[::-1]
+    sizes = np.floor(weights / weights.sum() * (num_samples - num_groups)).astype(int) + 1
+    sizes[0] += num_samples - sizes.sum()
+    return sizes
+
+def generate_profiles(group_sizes, num_loci, divergence, missing_rate, duplication_rate, rng):
+    '''
+    Generates cgMLST-like allele profiles, the members of a group are descended from a founder profile
+    :param group_sizes: numpy array of group sizes
+    :param num_loci: int number of loci
+    :param divergence: float mean number of loci at which a member differs from its group founder
+    :param missing_rate: float fraction of missing alleles (0)
+    :param duplication_rate: float fraction of samples that are exact copies of an earlier member of their group
+    :param rng: numpy Generator
+    :return: numpy int array of profiles, one row per sample in group order
+    '''
+    profiles = np.zeros((int(group_sizes.sum()), num_loci), dtype=np.int32)
+    start = 0
+    for size in group_sizes:
+        founder = rng.integers(1, FOUNDER_ALLELES + 1, num_loci)
+        rows = np.tile(founder, (size, 1))
+        num_mutations = rng.poisson(divergence, size)
+        for i in range(size):
+            loci = rng.integers(0, num_loci, num_mutations[i])
+            rows[i, loci] = rng.integers(FOUNDER_ALLELES + 1, MAX_ALLELE + 1, len(loci))
+        rows[rng.random(rows.shape) < missing_rate] = 0
+
+        # Clonal duplicates copy the profile, including the missing alleles, of an earlier member:
+        duplicates = np.flatnonzero(rng.random(size) < duplication_rate)
+        duplicates = duplicates[duplicates > 0]
+        rows[duplicates] = rows[rng.integers(0, duplicates)]
+
+        profiles[start:start + size] = rows
+        start += size
+
+    return profiles
+
+def generate_metadata(sample_ids, group_sizes, rng):
+    '''
+    Generates metadata with categorical, numeric and date columns to summarize
+    :param sample_ids: list of sample ids in group order
+    :param group_sizes: numpy array of group sizes
+    :param rng: numpy Generator
+    :return: pd
+    '''
+    num_samples = len(sample_ids)
+    group_ids = np.repeat([f"G{i + 1}" for i in range(len(group_sizes))], group_sizes)
+    dates = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 5 * 365, num_samples), unit='D')
+    df = pd.DataFrame({
+        ID_COLUMN: sample_ids,
+        PARTITION_COLUMN: group_ids,
+        'country': rng.choice(COUNTRIES, num_samples),
+        'host': rng.choice(HOSTS, num_samples),
+        'age': rng.integers(0, 90, num_samples).astype(str),
+        'collection_date': dates.strftime('%Y-%m-%d'),
+    })
+    # Some of the ages and dates are unknown:
+    df.loc[rng.random(num_samples) < 0.1, 'age'] = ''
+    df.loc[rng.random(num_samples) < 0.1, 'collection_date'] = ''
+    return df
+
+def get_config(thresholds):
+    '''
+    Creates a config summarizing every generated metadata column
+    :param thresholds: str thresholds delimited by ,
+    :return: dict
+    '''
+    return {
+        "outlier_thresh": "25",
+        "method": "average",
+        "thresholds": thresholds,
+        "min_members": 2,
+        "partition_col": PARTITION_COLUMN,
+        "id_col": ID_COLUMN,
+        "only_report_labeled_columns": "False",
+        "grouped_metadata_columns": {
+            PARTITION_COLUMN: {"data_type": "None", "label": "OutbreakID", "default": "", "display": "True"},
+            "country": {"data_type": "categorical", "label": "Country", "default": "", "display": "True"},
+            "host": {"data_type": "none", "label": "Host", "default": "", "display": "True"},
+            "age": {"data_type": "desc_stats", "label": "Age", "default": "", "display": "True"},
+            "collection_date": {"data_type": "min_max", "label": "Collection date", "default": "", "display": "True"},
+        },
+        "linelist_columns": {
+            ID_COLUMN: {"data_type": "None", "label": "Identifier", "default": "", "display": "True"},
+            PARTITION_COLUMN: {"data_type": "None", "label": "OutbreakID", "default": "", "display": "True"},
+            "country": {"data_type": "categorical", "label": "Country", "default": "", "display": "True"},
+            "collection_date": {"data_type": "None", "label": "Collection date", "default": "", "display": "True"},
+        }
+    }
+
+def generate_dataset(outdir, num_samples=1000, num_loci=3000, num_groups=50, distribution='zipf', divergence=10,
+                     missing_rate=0.01, duplication_rate=0.1, thresholds="10,5,2,1,0", seed=42):
+    '''
+    Writes a synthetic dataset (profile.tsv, metadata.tsv and config.json) to outdir
+    :return: dict describing the dataset
+    '''
+    rng = np.random.default_rng(seed)
+    group_sizes = get_group_sizes(num_samples, num_groups, distribution, rng)
+    profiles = generate_profiles(group_sizes, num_loci, divergence, missing_rate, duplication_rate, rng)
+    sample_ids = [f"S{i + 1}" for i in range(num_samples)]
+
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir, 0o755)
+
+    files = {
+        'profile': os.path.join(outdir, "profile.tsv"),
+        'metadata': os.path.join(outdir, "metadata.tsv"),
+        'config': os.path.join(outdir, "config.json"),
+    }
+    profile_df = pd.DataFrame(profiles, index=pd.Index(sample_ids, name=ID_COLUMN), columns=[f"locus_{i + 1}" for i in range(num_loci)])
+    profile_df.to_csv(files['profile'], sep="\t", header=True, index=True)
+    generate_metadata(sample_ids, group_sizes, rng).to_csv(files['metadata'], sep="\t", header=True, index=False)
+    with open(files['config'], 'w') as fh:
+        fh.write(json.dumps(get_config(thresholds), indent=4))
+
+    return {
+        'files': files,
+        'num_samples': num_samples,
+        'num_loci': num_loci,
+        'num_groups': num_groups,
+        'group_size_distribution': distribution,
+        'largest_group': int(group_sizes[0]),
+        'count_singleton_groups': int((group_sizes == 1).sum()),
+        'count_pairs': int((group_sizes * (group_sizes - 1) // 2).sum()),
+        'divergence': divergence,
+        'missing_rate': missing_rate,
+        'duplication_rate': duplication_rate,
+        'seed': seed,
+    }
+
+def add_dataset_arguments(parser):
+    parser.add_argument('--num_samples', type=int, default=1000, help='Number of samples')
+    parser.add_argument('--num_loci', type=int, default=3000, help='Number of loci')
+    parser.add_argument('--num_groups', type=int, default=50, help='Number of groups (partitions)')
+    parser.add_argument('--distribution', type=str, default='zipf', choices=GROUP_SIZE_DISTRIBUTIONS,
+                        help='Distribution of the group sizes')
+    parser.add_argument('--divergence', type=float, default=10,
+                        help='Mean number of loci at which a sample differs from its group founder')
+    parser.add_argument('--missing_rate', type=float, default=0.01, help='Fraction of missing alleles')
+    parser.add_argument('--duplication_rate', type=float, default=0.1,
+                        help='Fraction of samples that are exact copies of another sample of their group')
+    parser.add_argument('--thresholds', type=str, default="10,5,2,1,0", help='Thresholds written to config.json')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed, the same seed always generates the same dataset')
+
+def get_dataset_parameters(args):
+    return {
+        'num_samples': args.num_samples,
+        'num_loci': args.num_loci,
+        'num_groups': args.num_groups,
+        'distribution': args.distribution,
+        'divergence': args.divergence,
+        'missing_rate': args.missing_rate,
+        'duplication_rate': args.duplication_rate,
+        'thresholds': args.thresholds,
+        'seed': args.seed,
+    }
+
+def main():
+    parser = ArgumentParser(description="Generates a synthetic cgMLST dataset for benchmarking arborator",
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--outdir', type=str, required=True, help='Output directory of the dataset')
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+    dataset = generate_dataset(args.outdir, **get_dataset_parameters(args))
+    print(json.dumps(dataset, indent=4))
+
+# call main function
+if __name__ == '__main__':
+    main()